@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Scaling benchmark of the pipeline on synthetic data.
+
+    python anac_benchmark.py out_dir [--scales 1 10 100] [--repeat 3]
+
+For each scale (in years of data, see anac_synthetic) a resumo_anual file
+is generated once under out_dir/data and the pipeline stages are timed on
+it: parsing the CSV, reading it back from the loader cache, the derived
+columns, the consistency check, the cube aggregation and rollups, the
+mini-batch clustering and the passenger weight calibration. Each stage is
+run repeat times and its median kept.
+
+The results of every run are appended to out_dir/results.csv with the run
+time, the git commit, the generator version and seed, and the library
+versions, so runs on the same data can be compared over time.
+"""
+
+import argparse
+import os
+import platform
+import shutil
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+from anac_calibration import calibrate
+from anac_clustering import minibatch_cmeans
+from anac_consistency import check_consistency
+from anac_cube import Cube
+from anac_derive import add_derived_columns
+from anac_instrument import Instrument
+from anac_loader import load_anac
+from anac_synthetic import GENERATOR_VERSION, generate, write_resumo
+from anac_weights import passenger_weights
+
+SCALES = [1, 10]
+REPEAT = 3
+STAGES = ['load', 'load_cached', 'derive', 'consistency', 'aggregate',
+          'cluster', 'calibration']
+
+# numeric features of the clustering benchmark
+CLUSTER_FEATURES = ['passageiros_pagos', 'carga_paga_kg', 'correio_kg',
+                    'bagagem_kg', 'distancia_voada_km', 'decolagens',
+                    'assentos', 'payload', 'horas_voadas', 'rtk']
+
+
+def data_file(out_dir, scale, seed=0):
+    """Path of the synthetic file of a scale, generated if missing."""
+    name = 'resumo_anual_x{}_s{}_v{}.csv'.format(scale, seed,
+                                                 GENERATOR_VERSION)
+    path = os.path.join(out_dir, 'data', name)
+    if not os.path.exists(path):
+        write_resumo(generate(scale, seed=seed), path)
+    return path
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def cluster_data(df):
+    """Scaled float matrix of CLUSTER_FEATURES over the complete rows."""
+    x = df[CLUSTER_FEATURES].astype(np.float64).dropna().to_numpy()
+    return (x - x.mean(axis=0)) / np.maximum(x.std(axis=0), 1e-12)
+
+
+def _aggregate(df):
+    cube = Cube.from_frame(df)
+    cube.rollup(['data', 'aeroporto_de_origem_nome'], 'decolagens')
+    cube.rollup(['rota_nome'], ['rpk', 'ask'])
+    cube.rollup(['data', 'empresa_nacionalidade'])
+    return cube
+
+
+def run_stages(path, inst, seed=0):
+    """Time the STAGES once on the file at path with inst."""
+    folder, name = os.path.split(path)
+    cache_dir = os.path.join(folder, '.anac_cache_' + name)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    with inst.stage('load') as stage:
+        df = load_anac(folder, [name], use_cache=False)
+        stage.rows = len(df)
+    load_anac(folder, [name], cache_dir=cache_dir)
+    with inst.stage('load_cached', len(df)):
+        df = load_anac(folder, [name], cache_dir=cache_dir)
+    with inst.stage('derive', len(df)):
+        df = add_derived_columns(df)
+    with inst.stage('consistency', len(df)):
+        check_consistency(df, avgw=passenger_weights(df))
+    with inst.stage('aggregate', len(df)):
+        _aggregate(df)
+    x = cluster_data(df)
+    with inst.stage('cluster', len(x)):
+        minibatch_cmeans(x, 3, seed=seed)
+    with inst.stage('calibration', len(df)):
+        calibrate(df, by=['empresa_sigla', 'ano'])
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def benchmark(out_dir, scales=SCALES, repeat=REPEAT, seed=0):
+    """Frame with the median metrics of each stage at each scale."""
+    frames = []
+    for scale in scales:
+        path = data_file(out_dir, scale, seed)
+        inst = Instrument()
+        for _ in range(repeat):
+            run_stages(path, inst, seed)
+        frames.append(inst.frame().assign(
+            scale=scale, file_bytes=os.path.getsize(path)))
+    metrics = pd.concat(frames, ignore_index=True)
+    out = (metrics.groupby(['scale', 'stage'], sort=False)
+           .agg(rows=('rows', 'max'), file_bytes=('file_bytes', 'max'),
+                wall=('wall', 'median'), wall_min=('wall', 'min'),
+                cpu=('cpu', 'median'), peak_rss=('peak_rss', 'max'))
+           .reset_index())
+    out['rows_per_s'] = out['rows'] / out['wall']
+    env = {'run': metrics['run'].iloc[0], 'commit': _commit(),
+           'generator': GENERATOR_VERSION, 'seed': seed, 'repeat': repeat,
+           'python': platform.python_version(), 'pandas': pd.__version__,
+           'numpy': np.__version__, 'cpus': os.cpu_count()}
+    return out.assign(**env)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the pipeline on synthetic ANAC data.')
+    parser.add_argument('out_dir', help='folder for the data and results')
+    parser.add_argument('--scales', nargs='+', type=float, default=SCALES,
+                        help='sizes in years of data (default: 1 10)')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    scales = [int(s) if s == int(s) else s for s in args.scales]
+    results = benchmark(args.out_dir, scales, args.repeat, args.seed)
+    path = os.path.join(args.out_dir, 'results.csv')
+    results.to_csv(path, mode='a', header=not os.path.exists(path),
+                   index=False)
+    print(results.pivot(index='stage', columns='scale',
+                        values='wall').loc[STAGES].to_string())
+    print('results appended to', path)
+
+
+if __name__ == '__main__':
+    main()
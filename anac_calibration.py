@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Calibration of the average passenger weight used in the RTK calculation.
+
+For a passenger weight k the calculated RTK of a row is linear in k:
+
+    rtk_calc(k) = (k * pax + cargo + mail + baggage) * dist
+                  / (1000 * takeoffs)
+                = a * k + b
+
+so the row matches the reported RTK (|rtk - rtk_calc(k)| < tolerance) on
+the open interval ((rtk - b - tolerance) / a, (rtk - b + tolerance) / a).
+Rows without takeoffs or passengers match for every k or for none; rows
+with a missing input match for none. The
+number of matching rows as a function of k is then a step function that
+can be read exactly from the sorted interval endpoints, for any grouping
+of the rows, instead of searching it with a scalar optimizer.
+"""
+
+import numpy as np
+import pandas as pd
+
+from anac_consistency import TOLERANCE, float_values
+
+BOUNDS = (70, 150)
+
+
+def match_intervals(df, tolerance=TOLERANCE):
+    """Frame with the interval (lo, hi) of k over which each row matches.
+    Rows whose match does not depend on k get NaN bounds and the outcome
+    in the 'always' column."""
+    rtk = float_values(df, 'rtk')
+    takeoffs = float_values(df, 'decolagens')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_flight = (float_values(df, 'distancia_voada_km')
+                      / (1000 * takeoffs))
+        a = float_values(df, 'passageiros_pagos') * per_flight
+        b = (float_values(df, 'carga_paga_kg')
+             + float_values(df, 'correio_kg')
+             + float_values(df, 'bagagem_kg')) * per_flight
+        zero = takeoffs == 0
+        fixed = zero | (a == 0) | ~np.isfinite(a)
+        # rows with a missing input (non-finite a) have no calculated
+        # RTK and never match
+        always = np.where(zero, np.abs(rtk) < tolerance,
+                          (a == 0) & (np.abs(rtk - b) < tolerance))
+        lo = (rtk - b - tolerance) / a
+        hi = (rtk - b + tolerance) / a
+    lo, hi = np.minimum(lo, hi), np.maximum(lo, hi)
+    lo[fixed] = np.nan
+    hi[fixed] = np.nan
+    return pd.DataFrame({'lo': lo, 'hi': hi, 'always': always},
+                        index=df.index)
+
+
+def _groups(df, by):
+    """Group labels of by and the row positions of each group."""
+    if by is None:
+        return pd.Index(['all']), [np.arange(len(df))]
+    if isinstance(by, str):
+        keys = pd.Index(df[by])
+    else:
+        keys = pd.MultiIndex.from_frame(df[by])
+    codes, groups = keys.factorize()
+    order = np.argsort(codes, kind='stable')
+    order = order[codes[order] >= 0]
+    if len(groups) == 0:
+        return groups, []
+    counts = np.bincount(codes[codes >= 0], minlength=len(groups))
+    return groups, np.split(order, np.cumsum(counts)[:-1])
+
+
+def _sorted_endpoints(intervals, positions):
+    lo = intervals['lo'].to_numpy()[positions]
+    hi = intervals['hi'].to_numpy()[positions]
+    valid = ~np.isnan(lo)
+    always = int(intervals['always'].to_numpy()[positions].sum())
+    return np.sort(lo[valid]), np.sort(hi[valid]), always
+
+
+def matching_count(df, k, by=None, tolerance=TOLERANCE):
+    """Number of matching rows for each weight in k (scalar or array).
+    Returns a frame indexed by k with one column per group of by (a
+    column name or list of names; None for the whole frame)."""
+    ks = np.atleast_1d(np.asarray(k, dtype=np.float64))
+    intervals = match_intervals(df, tolerance)
+    groups, positions = _groups(df, by)
+    out = {}
+    for group, pos in zip(groups, positions):
+        lo, hi, always = _sorted_endpoints(intervals, pos)
+        out[group] = (always + np.searchsorted(lo, ks, side='left')
+                      - np.searchsorted(hi, ks, side='right'))
+    return pd.DataFrame(out, index=pd.Index(ks, name='k'),
+                        columns=groups)
+
+
+def _best_weight(lo, hi, bounds):
+    """Open segment of k within bounds where most intervals overlap.
+    Returns (count, segment start, segment end)."""
+    kmin, kmax = bounds
+    points = np.concatenate([lo, hi, bounds])
+    delta = np.concatenate([np.ones(len(lo), dtype=np.int64),
+                            -np.ones(len(hi), dtype=np.int64),
+                            [0, 0]])
+    order = np.argsort(points, kind='stable')
+    points, count = points[order], np.cumsum(delta[order])
+    # count after all the events at a point holds until the next point
+    last = np.r_[points[1:] != points[:-1], True]
+    points, count = points[last], count[last]
+    starts, ends, count = points[:-1], points[1:], count[:-1]
+    inside = (starts >= kmin) & (ends <= kmax)
+    if not inside.any():
+        return 0, kmin, kmax
+    starts, ends, count = starts[inside], ends[inside], count[inside]
+    best = np.argmax(count)
+    return int(count[best]), starts[best], ends[best]
+
+
+def calibrate(df, by=None, bounds=BOUNDS, tolerance=TOLERANCE):
+    """Best average passenger weight per group of by (a column name or
+    list of names, e.g. 'empresa_nacionalidade', 'empresa_sigla' or
+    ['empresa_sigla', 'ano']; None for the whole frame).
+
+    Returns a frame indexed by group with the chosen weight k (middle of
+    the best segment), the segment k_min..k_max over which the same
+    number of rows match, the matches, the rows and the match rate.
+    Groups where no weight within bounds matches any more rows than the
+    others are not calibrated: their k, k_min and k_max are NaN.
+    """
+    intervals = match_intervals(df, tolerance)
+    groups, positions = _groups(df, by)
+    out = []
+    for pos in positions:
+        lo, hi, always = _sorted_endpoints(intervals, pos)
+        count, start, end = _best_weight(lo, hi, bounds)
+        if count == 0:
+            start = end = np.nan
+        out.append({'k': (start + end) / 2, 'k_min': start, 'k_max': end,
+                    'matches': always + count, 'rows': len(pos)})
+    result = pd.DataFrame(out, index=groups,
+                          columns=['k', 'k_min', 'k_max', 'matches', 'rows'])
+    result['rate'] = result['matches'] / result['rows']
+    return result
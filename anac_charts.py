@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Rendering of the report charts.
+
+The charts are drawn from frames the pipeline has already aggregated (cube
+rollups, top-K tables, series), with one row per bar, so seaborn only has
+to draw them: catplot() turns off the bootstrapped confidence intervals
+(errorbar=None) and drops the unused categories. A Chart holds what is
+needed to draw one figure; render_all() draws a batch of them and writes
+each as PNG and/or SVG, in worker processes when workers > 1.
+
+facet_charts() splits a frame into one Chart per key (one per airport or
+route), for the per-airport and per-route pages of the report.
+"""
+
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+from anac_derive import observed_categories
+
+FORMATS = ('png', 'svg')
+DPI = 100
+
+Chart = namedtuple('Chart', ['name', 'data', 'x', 'y', 'title', 'xlabel',
+                             'ylabel', 'rotate', 'options'])
+
+
+def catplot(data, x, y, kind='bar', **kwargs):
+    """sns.catplot of an aggregated frame, without confidence intervals and
+    with only the observed categories."""
+    if kind in ('bar', 'point'):
+        kwargs.setdefault('errorbar', None)
+    return sns.catplot(x=x, y=y, data=observed_categories(data), kind=kind,
+                       **kwargs)
+
+
+def chart(name, data, x, y, title=None, xlabel=None, ylabel=None, rotate=90,
+          **options):
+    """Chart named name (the file name, without extension) of y per x in
+    data. options are passed to catplot (kind, hue, col, col_wrap, ...);
+    rotate is the angle of the x tick labels."""
+    return Chart(name, data, x, y, title, xlabel, ylabel, rotate, options)
+
+
+def facet_charts(name, data, x, y, by, title='{}', **kwargs):
+    """One chart per key of the column by, named name + '_' + key and
+    titled title.format(key)."""
+    charts = []
+    for key, group in data.groupby(by, observed=True, sort=True):
+        label = str(key[0] if isinstance(key, tuple) else key)
+        safe = ''.join(c if c.isalnum() or c in '-_' else '_' for c in label)
+        charts.append(chart('{}_{}'.format(name, safe), group, x, y,
+                            title=title.format(label), **kwargs))
+    return charts
+
+
+def draw(c):
+    """Draw a Chart; returns the seaborn FacetGrid."""
+    grid = catplot(c.data, c.x, c.y, **c.options)
+    if c.rotate:
+        grid.set_xticklabels(rotation=c.rotate, ha='right')
+    if c.xlabel is not None:
+        grid.set_xlabels(c.xlabel)
+    if c.ylabel is not None:
+        grid.set_ylabels(c.ylabel)
+    if c.title:
+        grid.figure.suptitle(c.title)
+    return grid
+
+
+def save(c, out_dir, formats=FORMATS, dpi=DPI):
+    """Draw a Chart, write it to out_dir in each format and close it.
+    Returns the paths written."""
+    grid = draw(c)
+    paths = []
+    try:
+        grid.figure.tight_layout()
+        for fmt in formats:
+            path = os.path.join(out_dir, '{}.{}'.format(c.name, fmt))
+            grid.figure.savefig(path, dpi=dpi)
+            paths.append(path)
+    finally:
+        plt.close(grid.figure)
+    return paths
+
+
+def _init_worker():
+    plt.switch_backend('Agg')
+
+
+def _save_task(task):
+    return save(*task)
+
+
+def render_all(charts, out_dir, formats=FORMATS, dpi=DPI, workers=1):
+    """Write every Chart to out_dir; returns the list of paths written per
+    chart. With workers > 1 the charts are drawn in that many processes
+    (call it under if __name__ == '__main__' on Windows)."""
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = [(c, out_dir, tuple(formats), dpi) for c in charts]
+    if workers == 1 or len(tasks) < 2:
+        return [_save_task(t) for t in tasks]
+    with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+        return list(pool.map(_save_task, tasks,
+                             chunksize=max(1, len(tasks) // (4 * workers))))
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Fuzzy c-means over a range of cluster counts.
+
+cmeans_sweep fits skfuzzy's cmeans for each k of a range. The k values run
+in waves of `workers` processes; with warm_start each k is initialised from
+the solution of the largest k already fitted, plus new centers placed on
+the points that solution represents worst, instead of a random partition.
+With plateau set, the sweep stops once the FPC (fuzzy partition
+coefficient) changes by less than plateau for patience consecutive k.
+
+minibatch_cmeans is a lighter engine for large inputs: it runs in float32,
+fits the centers on mini-batches (or on a stratified sample of the rows)
+and then assigns the memberships of all the rows block by block, so the
+full (c, N) membership matrix is never held in memory.
+
+The data is a frame or array with one row per sample (the transpose of
+what skfuzzy takes).
+"""
+
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import skfuzzy as fuzz
+
+# fpc: fuzzy partition coefficient per k
+# centers: {k: frame with the k centers, one column per feature}
+# memberships: {k: (k, N) membership matrix}, empty without keep_memberships
+# iterations: number of iterations run per k
+SweepResult = namedtuple('SweepResult',
+                         ['fpc', 'centers', 'memberships', 'iterations'])
+
+# centers: frame with the c centers, one column per feature
+# fpc: fuzzy partition coefficient over all the rows
+# labels: cluster of highest membership of each row
+# iterations: number of passes over the fitted rows
+CmeansResult = namedtuple('CmeansResult',
+                          ['centers', 'fpc', 'labels', 'iterations'])
+
+BATCH_SIZE = 10000
+BLOCK = 100000
+
+
+def memberships(x, centers, m=2):
+    """(c, N) fuzzy c-means membership of the rows of x to the centers,
+    in the dtype of x."""
+    x = np.asarray(x)
+    d = np.empty((len(centers), len(x)), dtype=x.dtype)
+    for j, center in enumerate(np.asarray(centers, dtype=x.dtype)):
+        diff = x - center
+        d[j] = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+    d = np.fmax(d, np.finfo(x.dtype).eps)
+    u = d ** (-2. / (m - 1))
+    return u / u.sum(axis=0)
+
+
+def fpc(u):
+    """Fuzzy partition coefficient of a (c, N) membership matrix."""
+    return float((u * u).sum() / u.shape[1])
+
+
+def seed_centers(x, centers, c, m=2):
+    """Extend centers to c centers, adding one at a time the row of x with
+    the lowest highest membership to the current centers."""
+    centers = np.asarray(centers)
+    while len(centers) < c:
+        worst = memberships(x, centers, m).max(axis=0).argmin()
+        centers = np.vstack([centers, x[worst]])
+    return centers
+
+
+def _fit(x, k, centers, m, error, maxiter, seed):
+    init = None
+    if centers is not None:
+        init = memberships(x, seed_centers(x, centers, k, m), m)
+    cntr, u, _, _, _, p, f = fuzz.cluster.cmeans(
+        x.T, k, m, error=error, maxiter=maxiter, init=init, seed=seed)
+    return k, cntr, u, f, p
+
+
+_DATA = None
+
+
+def _init_worker(x):
+    global _DATA
+    _DATA = x
+
+
+def _fit_worker(args):
+    return _fit(_DATA, *args)
+
+
+def _plateau(fpcs, tolerance, patience):
+    values = fpcs.sort_index().to_numpy()
+    if len(values) <= patience:
+        return False
+    return bool((np.abs(np.diff(values[-patience - 1:])) < tolerance).all())
+
+
+def cmeans_sweep(data, ks, m=2, error=0.001, maxiter=10000, warm_start=True,
+                 plateau=None, patience=2, workers=1, keep_memberships=True,
+                 seed=None):
+    """Fit fuzzy c-means for each cluster count in ks and return a
+    SweepResult. workers=None uses one process per CPU."""
+    columns = getattr(data, 'columns', None)
+    x = np.ascontiguousarray(data, dtype=np.float64)
+    ks = sorted(ks)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(ks)))
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                   initargs=(x,))
+    fpcs = pd.Series(dtype=np.float64)
+    fpcs.index.name = 'k'
+    iterations = pd.Series(dtype=np.int64)
+    centers = {}
+    members = {}
+    try:
+        for start in range(0, len(ks), workers):
+            tasks = []
+            for k in ks[start:start + workers]:
+                prev = [j for j in centers if j < k]
+                init = centers[max(prev)] if warm_start and prev else None
+                tasks.append((k, None if init is None else init.to_numpy(),
+                              m, error, maxiter, seed))
+            if pool is None:
+                fits = [_fit(x, *t) for t in tasks]
+            else:
+                fits = pool.map(_fit_worker, tasks)
+            for k, cntr, u, f, p in fits:
+                centers[k] = pd.DataFrame(cntr, columns=columns)
+                fpcs[k] = f
+                iterations[k] = p
+                if keep_memberships:
+                    members[k] = u
+            if plateau is not None and _plateau(fpcs, plateau, patience):
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    iterations.index.name = 'k'
+    return SweepResult(fpcs.sort_index(), centers, members,
+                       iterations.sort_index())
+
+
+def iter_memberships(x, centers, m=2, block=BLOCK):
+    """Yield (first row, (c, rows) memberships) for consecutive blocks of
+    block rows of x."""
+    for start in range(0, len(x), block):
+        yield start, memberships(x[start:start + block], centers, m)
+
+
+def assign(data, centers, m=2, block=BLOCK):
+    """Labels (cluster of highest membership) and FPC of all the rows of
+    data, computed block by block."""
+    x = np.asarray(data, dtype=np.asarray(centers).dtype)
+    labels = np.empty(len(x), dtype=np.int32)
+    total = 0.
+    for start, u in iter_memberships(x, centers, m, block):
+        labels[start:start + u.shape[1]] = u.argmax(axis=0)
+        total += float((u.astype(np.float64) ** 2).sum())
+    return labels, total / max(len(x), 1)
+
+
+def stratified_sample(strata, size, seed=None):
+    """Positions of about size rows, taken from each stratum in proportion
+    to its number of rows (at least one row per stratum)."""
+    codes, uniques = pd.factorize(np.asarray(strata), use_na_sentinel=False)
+    counts = np.bincount(codes, minlength=len(uniques))
+    quota = np.maximum(np.round(counts * size / len(codes)), 1)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(codes))
+    rank = pd.Series(codes[order]).groupby(codes[order]).cumcount()
+    return np.sort(order[rank.to_numpy() < quota[codes[order]]])
+
+
+def minibatch_cmeans(data, c, m=2, batch_size=BATCH_SIZE, error=0.001,
+                     maxiter=300, decay=0.5, sample=None, strata=None,
+                     block=BLOCK, seed=None):
+    """Fuzzy c-means in float32 on mini-batches of batch_size rows.
+
+    With sample, the centers are fitted on a sample of that many rows
+    (stratified by strata when given) instead of on all the rows. Each
+    pass over the fitted rows updates the centers once per batch, moving
+    them towards the batch's weighted mean with a rate that decreases with
+    the membership weight accumulated in the pass (plus decay times the
+    weight of the previous passes). The fit stops when a pass moves no
+    center by more than error times the spread of the features (with a
+    single batch and decay=0 this is the usual full-batch iteration).
+    Returns a CmeansResult over all the rows of data.
+    """
+    columns = getattr(data, 'columns', None)
+    x = np.ascontiguousarray(data, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    fit = x
+    if sample is not None and sample < len(x):
+        if strata is None:
+            rows = np.sort(rng.choice(len(x), sample, replace=False))
+        else:
+            rows = stratified_sample(strata, sample, rng)
+        fit = x[rows]
+    scale = fit.std(axis=0)
+    scale[scale == 0] = 1
+    centers = fit[rng.choice(len(fit), c, replace=False)].copy()
+    weight = np.zeros(c, dtype=np.float32)
+    tiny = np.finfo(np.float32).tiny
+    for it in range(1, maxiter + 1):
+        previous = centers.copy()
+        weight *= decay
+        order = rng.permutation(len(fit))
+        for start in range(0, len(fit), batch_size):
+            batch = fit[np.sort(order[start:start + batch_size])]
+            w = memberships(batch, centers, m) ** m
+            bw = w.sum(axis=1)
+            weight += bw
+            rate = (bw / np.fmax(weight, tiny))[:, None]
+            mean = (w @ batch) / np.fmax(bw, tiny)[:, None]
+            centers += rate * (mean - centers)
+        if (np.abs(centers - previous) / scale).max() < error:
+            break
+    labels, f = assign(x, centers, m, block)
+    return CmeansResult(pd.DataFrame(centers, columns=columns), f, labels, it)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Consistency check of the reported RPK, ASK, RTK and ATK values.
+
+The metrics are recomputed from the variables that compose them:
+
+    RPK = paying passengers * distance / takeoffs
+    ASK = seats * distance / takeoffs
+    RTK = (avgw * paying passengers + cargo + mail + baggage) * distance
+          / (1000 * takeoffs)
+    ATK = payload * distance / (1000 * takeoffs)
+
+A reported value matches when it is within the tolerance of the calculated
+one. Rows without takeoffs match when the reported value itself is within
+the tolerance of zero, and get NaN as the calculated value.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+METRICS = ['rpk', 'ask', 'rtk', 'atk']
+TOLERANCE = 1000
+
+# rate: match rate per metric
+# by_airline / by_month: match rate per metric for each airline / month
+# mismatches: {metric: index labels of the rows that do not match} (empty
+#     when they were not kept)
+ConsistencyReport = namedtuple('ConsistencyReport',
+                               ['rate', 'by_airline', 'by_month',
+                                'mismatches'])
+
+
+def float_values(df, col):
+    """Column as a float64 array, with NaN for missing values."""
+    return df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def calc_metrics(df, avgw=75, metrics=METRICS):
+    """Recalculate the given metrics. avgw is the average passenger weight
+    (kg) used for RTK, either a scalar or one value per row. Returns a
+    frame with a <metric>_calc column per metric."""
+    dist = float_values(df, 'distancia_voada_km')
+    takeoffs = float_values(df, 'decolagens')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_flight = np.where(takeoffs == 0, np.nan, dist / takeoffs)
+        out = {}
+        for metric in metrics:
+            if metric == 'rpk':
+                calc = float_values(df, 'passageiros_pagos') * per_flight
+            elif metric == 'ask':
+                calc = float_values(df, 'assentos') * per_flight
+            elif metric == 'rtk':
+                weight = (np.asarray(avgw, dtype=np.float64)
+                          * float_values(df, 'passageiros_pagos')
+                          + float_values(df, 'carga_paga_kg')
+                          + float_values(df, 'correio_kg')
+                          + float_values(df, 'bagagem_kg'))
+                calc = weight * per_flight / 1000
+            elif metric == 'atk':
+                calc = float_values(df, 'payload') * per_flight / 1000
+            else:
+                raise ValueError('unknown metric: {}'.format(metric))
+            out[metric + '_calc'] = calc
+    return pd.DataFrame(out, index=df.index)
+
+
+def match_masks(df, calc, tolerance=TOLERANCE):
+    """Boolean frame (one column per metric) telling which reported values
+    match the calculated ones in calc."""
+    metrics = [c[:-len('_calc')] for c in calc.columns]
+    reported = np.column_stack([float_values(df, m) for m in metrics])
+    zero = (float_values(df, 'decolagens') == 0)[:, None]
+    expected = np.where(zero, 0, calc.to_numpy(dtype=np.float64))
+    with np.errstate(invalid='ignore'):
+        ok = np.abs(reported - expected) < tolerance
+    return pd.DataFrame(ok, index=df.index, columns=metrics)
+
+
+def _month_key(df):
+    if 'data' in df.columns:
+        return df['data']
+    return df['ano'].astype(str) + '-' + df['mes'].map('{:02}'.format)
+
+
+def match_counts(df, ok, mismatches=True):
+    """Additive parts of a report: a dict with the matching rows per metric
+    plus a 'rows' count, in total, per airline and per month, and the
+    index labels of the mismatching rows per metric (none without
+    mismatches)."""
+    counts = ok.astype(np.int64)
+    counts['rows'] = 1
+    return {
+        'total': counts.sum(),
+        'by_airline': counts.groupby(df['empresa_sigla'].to_numpy()).sum(),
+        'by_month': counts.groupby(_month_key(df).to_numpy()).sum(),
+        'mismatches': {m: ok.index[~ok[m].to_numpy()] for m in ok.columns}
+        if mismatches else {}}
+
+
+def combine_counts(parts):
+    """Add up the match_counts of disjoint sets of rows."""
+    parts = list(parts)
+
+    def add(key):
+        return pd.concat([p[key] for p in parts]).groupby(level=0).sum()
+
+    return {
+        'total': sum(p['total'] for p in parts),
+        'by_airline': add('by_airline'),
+        'by_month': add('by_month'),
+        'mismatches': {m: parts[0]['mismatches'][m].append(
+            [p['mismatches'][m] for p in parts[1:]])
+            for m in parts[0]['mismatches']}}
+
+
+def report_from_counts(counts):
+    def rates(frame):
+        return frame.drop(columns='rows').div(frame['rows'], axis=0)
+
+    total = counts['total']
+    return ConsistencyReport(
+        rate=total.drop('rows') / total['rows'],
+        by_airline=rates(counts['by_airline']),
+        by_month=rates(counts['by_month']),
+        mismatches=counts['mismatches'])
+
+
+def build_report(df, ok):
+    """Summarize the match masks from match_masks."""
+    return report_from_counts(match_counts(df, ok))
+
+
+def check_consistency(df, avgw=75, metrics=METRICS, tolerance=TOLERANCE,
+                      add_columns=True):
+    """Recalculate the metrics, compare them with the reported values and
+    return a ConsistencyReport. With add_columns the <metric>_calc columns
+    are stored in df."""
+    calc = calc_metrics(df, avgw, metrics)
+    if add_columns:
+        for col in calc.columns:
+            df[col] = calc[col]
+    return build_report(df, match_masks(df, calc, tolerance))
+
+
+def print_rates(report):
+    for metric, rate in report.rate.items():
+        print('The number of {0} values that correspond to {0} calculation '
+              'is: {1:.2f}%'.format(metric, 100 * rate))
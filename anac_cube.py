@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-aggregated cube of the ANAC summary table.
+
+The row-level frame is aggregated once to its grain (month, airline,
+origin, destination, nature and flight group) keeping only the dimension
+columns and the additive measures. The resumo_anual files are already
+unique at that grain, so the base has as many cells as the frame has rows
+(7010 of 7010 in 2021): it saves nothing by itself. What it saves comes
+from the cuboids: the month x airline x route cuboid (without nature and
+flight group, COARSE_DROP) is computed with the base when it is smaller
+(5928 cells in 2021), and rollups (e.g. takeoffs per month and
+nationality) are answered from the smallest cuboid already computed that
+contains the requested dimensions. Every cuboid computed on the way is
+kept, so repeated queries over the same dimensions never rescan the rows.
+
+Ratios such as the load factor are not additive; compute them from the
+rolled-up sums (sum of RPK / sum of ASK). The cube also sums the PAIRED
+columns of anac_loadfactor for that.
+"""
+
+import pandas as pd
+
+from anac_derive import concat_frames
+from anac_loadfactor import PAIRED, paired_columns
+
+GRAIN = ['ano', 'mes', 'empresa_sigla',
+         'aeroporto_de_origem_sigla', 'aeroporto_de_destino_sigla',
+         'natureza', 'grupo_de_voo']
+
+# columns that only depend on the grain columns
+ATTRIBUTES = ['data', 'quarter', 'empresa_nome', 'empresa_nacionalidade',
+              'aeroporto_de_origem_nome', 'aeroporto_de_origem_uf',
+              'aeroporto_de_origem_regiao', 'aeroporto_de_origem_pais',
+              'aeroporto_de_origem_continente',
+              'aeroporto_de_destino_nome', 'aeroporto_de_destino_uf',
+              'aeroporto_de_destino_regiao', 'aeroporto_de_destino_pais',
+              'aeroporto_de_destino_continente',
+              'rota', 'rota_nome']
+
+MEASURES = ['passageiros_pagos', 'passageiros_gratis', 'carga_paga_kg',
+            'carga_gratis_kg', 'correio_kg', 'ask', 'rpk', 'atk', 'rtk',
+            'combustivel_litros', 'distancia_voada_km', 'decolagens',
+            'carga_paga_km', 'carga_gratis_km', 'correio_km', 'assentos',
+            'payload', 'horas_voadas', 'bagagem_kg',
+            'rpk_calc', 'ask_calc', 'rtk_calc', 'atk_calc'] + PAIRED
+
+# number of row-level records behind each cube cell
+COUNT = 'linhas'
+
+# dimensions left out of the coarse cuboid, computed with the base when it
+# has at most COARSE_RATIO of the base cells
+COARSE_DROP = ['natureza', 'grupo_de_voo']
+COARSE_RATIO = 0.9
+
+
+def _widen(frame, measures):
+    """Measures as 64-bit numbers, so that the sums of the narrow columns
+    of the loader neither overflow nor lose precision."""
+    wide = {}
+    for col in measures:
+        dtype = frame[col].dtype
+        if dtype.itemsize >= 8:
+            continue
+        if pd.api.types.is_float_dtype(dtype):
+            wide[col] = 'float64'
+        elif pd.api.types.is_integer_dtype(dtype):
+            signed = pd.api.types.is_signed_integer_dtype(dtype)
+            if isinstance(dtype, pd.api.extensions.ExtensionDtype):
+                wide[col] = 'Int64' if signed else 'UInt64'
+            else:
+                wide[col] = 'int64' if signed else 'uint64'
+    return frame.astype(wide) if wide else frame
+
+
+def _aggregate(frame, dims, measures):
+    return (frame.groupby(dims, observed=True, dropna=False, sort=True)
+            [measures].sum().reset_index())
+
+
+def as_list(x):
+    """x as a list of names (a single name becomes a one-item list)."""
+    return [x] if isinstance(x, str) else list(x)
+
+
+class Cube:
+    """Additive measures aggregated over a set of dimension columns."""
+
+    def __init__(self, base, dimensions, measures):
+        self.dimensions = list(dimensions)
+        self.measures = list(measures)
+        self._cuboids = {frozenset(self.dimensions): base}
+
+    @classmethod
+    def from_frame(cls, df, grain=GRAIN, attributes=ATTRIBUTES,
+                   measures=MEASURES):
+        """Aggregate a row-level frame to the cube grain. Columns missing
+        from df, and non-numeric measures, are left out; the PAIRED
+        measures are computed from df."""
+        dims = [c for c in list(grain) + list(attributes) if c in df.columns]
+        paired = {c: v for c, v in paired_columns(df).items()
+                  if c in measures}
+        measures = [c for c in measures if c in paired or (
+            c in df.columns and pd.api.types.is_numeric_dtype(df[c]))]
+        stored = [c for c in measures if c not in paired]
+        frame = _widen(df[dims + stored], stored).assign(
+            **paired, **{COUNT: 1})
+        base = _aggregate(frame, dims, measures + [COUNT])
+        cube = cls(base, dims, measures + [COUNT])
+        cube.coarsen()
+        return cube
+
+    @classmethod
+    def concat(cls, cubes):
+        """Cube over the rows of all the cubes (e.g. built per chunk), with
+        the dimensions and measures they have in common."""
+        cubes = list(cubes)
+        dims = [d for d in cubes[0].dimensions
+                if all(d in c.dimensions for c in cubes)]
+        measures = [m for m in cubes[0].measures
+                    if all(m in c.measures for c in cubes)]
+        base = concat_frames([c.base[dims + measures] for c in cubes])
+        cube = cls(_aggregate(base, dims, measures), dims, measures)
+        cube.coarsen()
+        return cube
+
+    @property
+    def base(self):
+        return self._cuboids[frozenset(self.dimensions)]
+
+    def coarsen(self, drop=COARSE_DROP, max_ratio=COARSE_RATIO):
+        """Compute the cuboid without the dimensions in drop, so that the
+        rollups that do not need them start from it, and keep it if it has
+        at most max_ratio of the base cells. Returns its number of cells
+        (None if it was not kept)."""
+        dims = frozenset(self.dimensions) - set(drop)
+        if dims == frozenset(self.dimensions) or not dims:
+            return None
+        cub = self.cuboid(dims)
+        if len(cub) > max_ratio * len(self.base):
+            del self._cuboids[dims]
+            return None
+        return len(cub)
+
+    def cuboid(self, dims):
+        """Flat frame with all the measures aggregated over dims."""
+        dims = frozenset(dims)
+        unknown = dims - set(self.dimensions)
+        if unknown:
+            raise KeyError('not a cube dimension: {}'.format(
+                ', '.join(sorted(unknown))))
+        if dims not in self._cuboids:
+            source = min((c for k, c in self._cuboids.items() if dims <= k),
+                         key=len)
+            self._cuboids[dims] = _aggregate(
+                source, [d for d in self.dimensions if d in dims],
+                self.measures)
+        return self._cuboids[dims]
+
+    def rollup(self, by, measures=None, where=None):
+        """Sum of measures (default: all) grouped by the dimensions in by,
+        indexed like df.groupby(by)[measures].sum(). where is a dict
+        {dimension: value or list of values} restricting the rows."""
+        by = as_list(by)
+        measures = self.measures if measures is None else as_list(measures)
+        where = where or {}
+        cub = self.cuboid(set(by) | set(where))
+        for dim, value in where.items():
+            values = [value] if isinstance(value, str) or not hasattr(
+                value, '__iter__') else list(value)
+            cub = cub[cub[dim].isin(values)]
+        return _aggregate(cub, by, measures).set_index(by)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Derived columns of the ANAC summary table.
+
+data, quarter, rota and rota_nome are computed from the integer codes of
+their source columns, so only the distinct values are ever turned into
+strings. They are stored as categoricals: the category order is
+chronological for the periods and alphabetical for the routes (the same
+order groupby would give with plain strings), and the codes
+(df['rota'].cat.codes, df['data'].cat.codes) can be used as route and
+period ids.
+"""
+
+import numpy as np
+import pandas as pd
+
+from anac_loadfactor import frame_load_factor
+
+
+def _labelled(keys, fmt):
+    """Categorical for an integer key array, each distinct key being
+    formatted once with fmt."""
+    uniq, codes = np.unique(keys, return_inverse=True)
+    labels = [fmt(k) for k in uniq.tolist()]
+    return pd.Categorical.from_codes(codes.reshape(-1), labels)
+
+
+def period_key(ano, mes):
+    """Integer year-month key (e.g. 202104), sortable chronologically."""
+    return np.asarray(ano, dtype=np.int64) * 100 + np.asarray(mes,
+                                                              dtype=np.int64)
+
+
+def month_labels(ano, mes):
+    """'YYYY-MM' labels, e.g. '2021-04'."""
+    return _labelled(period_key(ano, mes),
+                     lambda k: '{}-{:02}'.format(k // 100, k % 100))
+
+
+def quarter_labels(ano, mes):
+    """'YYYY-Qn' labels, e.g. '2021-Q2'."""
+    keys = (np.asarray(ano, dtype=np.int64) * 10
+            + (np.asarray(mes, dtype=np.int64) - 1) // 3 + 1)
+    return _labelled(keys, lambda k: '{}-Q{}'.format(k // 10, k % 10))
+
+
+def pair_labels(left, right, sep='->'):
+    """'left->right' labels for two aligned columns, e.g. the origin and
+    destination airports of each row."""
+    lcodes, luniq = pd.factorize(left, use_na_sentinel=False)
+    rcodes, runiq = pd.factorize(right, use_na_sentinel=False)
+    n = max(len(runiq), 1)
+    keys = lcodes.astype(np.int64) * n + rcodes
+    uniq, codes = np.unique(keys, return_inverse=True)
+    labels = np.array([str(luniq[k // n]) + sep + str(runiq[k % n])
+                       for k in uniq.tolist()], dtype=object)
+    order = np.argsort(labels, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return pd.Categorical.from_codes(rank[codes.reshape(-1)], labels[order])
+
+
+def add_derived_columns(df):
+    """Add data, quarter, rota, rota_nome and load_factor to df (in place)
+    and return it."""
+    df['data'] = month_labels(df['ano'], df['mes'])
+    df['quarter'] = quarter_labels(df['ano'], df['mes'])
+    df['rota'] = pair_labels(df['aeroporto_de_origem_sigla'],
+                             df['aeroporto_de_destino_sigla'])
+    df['rota_nome'] = pair_labels(df['aeroporto_de_origem_nome'],
+                                  df['aeroporto_de_destino_nome'])
+    df['load_factor'] = frame_load_factor(df)
+    return df
+
+
+def observed_categories(df):
+    """Copy of df with the unused categories dropped from its categorical
+    columns. Seaborn draws one bar/facet per category, so frames that only
+    hold a few routes (top 20, ...) should go through this before plotting."""
+    df = df.copy()
+    for col in df.select_dtypes('category').columns:
+        df[col] = df[col].cat.remove_unused_categories()
+    return df
+
+
+def concat_frames(frames):
+    """Concatenate frames whose categorical columns have different
+    categories, keeping them categorical (with sorted categories)."""
+    frames = [f for f in frames if len(f.columns)]
+    if not frames:
+        return pd.DataFrame()
+    first = frames[0]
+    for col in first.columns:
+        if isinstance(first[col].dtype, pd.CategoricalDtype):
+            cats = sorted(set().union(*(f[col].cat.categories
+                                        for f in frames)))
+            frames = [f.assign(**{col: f[col].cat.set_categories(cats)})
+                      for f in frames]
+    return pd.concat(frames, ignore_index=True)
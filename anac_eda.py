@@ -20,10 +20,19 @@ import os
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
-import unidecode
 
+from anac_charts import catplot
+from anac_consistency import check_consistency, print_rates
+from anac_cube import Cube
+from anac_derive import add_derived_columns
+from anac_loader import load_anac
+from anac_loadfactor import rollup_load_factor
+from anac_routes import RouteIndex
+from anac_topk import TopK
+from anac_weights import recalc_rtk
 
-# I am using the Seaborn library instead of matplotlib. I am also using the unidecode library to convert the column names to a more friendly format.
+
+# I am using the Seaborn library instead of matplotlib. The loading is done by the anac_loader module, which also converts the column names to a more friendly format (using the unidecode library) and keeps a cached copy of the parsed files, so the CSVs are only parsed again when they change.
 
 # Now the files are loaded and merged into a single dataframe.
 
@@ -36,9 +45,7 @@ dffiles = ['resumo_anual_2019.csv',
          'resumo_anual_2020.csv',
          'resumo_anual_2021.csv']
 
-df = pd.concat([pd.read_csv(os.path.join(folder, x),
-                            sep=';', encoding=('ISO-8859-1'))
-                for x in dffiles])
+df = load_anac(folder, dffiles)
 
 
 # Let's look at the data.
@@ -49,12 +56,12 @@ df = pd.concat([pd.read_csv(os.path.join(folder, x),
 print(df.head())
 
 
-# The following can be observed about the column names:
+# The following can be observed about the column names in the original files:
 # - They are written in Portuguese and contain accentuation;
 # - They are all in upper case letters;
 # - They contain spaces and parenthesis.
 # 
-# To facilitate readability we will modify the column names by:
+# To facilitate readability the loader modifies the column names by:
 # - Replacing the spaces with underlines "_";
 # - Removing the parenthesis;
 # - Making all letters lowercase; and
@@ -65,15 +72,8 @@ print(df.head())
 
 
 print("Column names before changes:\n")
-print(df.columns)
-
-df.columns = [unidecode.unidecode(z.lower())
-              .replace(' ','_')
-              .replace('(','')
-              .replace(')','') 
-              for z in df.columns]
-
-df.to_csv('3years.csv', sep=';', index=False)
+print(pd.read_csv(os.path.join(folder, dffiles[0]), sep=';',
+                  encoding='ISO-8859-1', nrows=0).columns)
 
 print("Column names after changes:\n")
 
@@ -90,18 +90,7 @@ print(df.columns)
 # In[5]:
 
 
-df['data'] = [str(x['ano']) + '-' + "{:02}".format(x['mes'])
-              for index, x in df.iterrows()]
-
-df['rota'] = [str(x['aeroporto_de_origem_sigla']) + '->' +
-              str(x['aeroporto_de_destino_sigla'])
-              for index, x in df.iterrows()]
-
-df['rota_nome'] = [str(x['aeroporto_de_origem_nome']) + '->' +
-              str(x['aeroporto_de_destino_nome'])
-              for index, x in df.iterrows()]
-
-df['load_factor'] = df['rpk']/df['ask']
+df = add_derived_columns(df)
 
 #df['rpk'] = df['rpk'].fillna(0)
 #df['ask'] = df['ask'].fillna(0)
@@ -137,51 +126,8 @@ df['load_factor'] = df['rpk']/df['ask']
 # In[7]:
 
 
-dummy = []
-for index, x in df.iterrows():
-    if x['decolagens'] == 0:
-        dummy.append(abs(x['rpk']) < 1000)
-    else:
-        dummy.append(abs(x['rpk'] - x['passageiros_pagos']*x['distancia_voada_km']/x['decolagens']) < 1000)
-print('The number of rpk values that correspond to rpk calculation is: {:.2f}%'.format(100*sum(dummy)/len(dummy)))
-df['rpk_calc']= df['passageiros_pagos']*df['distancia_voada_km']/df['decolagens']
-del dummy
-
-
-dummy = []
-for index, x in df.iterrows():
-    if x['decolagens'] == 0:
-        dummy.append(abs(x['ask']) < 1000)
-    else:
-        dummy.append(abs(x['ask'] - x['assentos']*x['distancia_voada_km']/x['decolagens']) < 1000)
-print('The number of ask values that correspond to ask calculation is: {:.2f}%'.format(100*sum(dummy)/len(dummy)))
-df['ask_calc']=df['assentos']*df['distancia_voada_km']/df['decolagens']
-
-del dummy
-
-dummy = []
-for index, x in df.iterrows():
-    if x['decolagens'] == 0:
-        dummy.append(abs(x['rtk']) < 1000)
-    else:
-        dummy.append(abs(x['rtk'] - (75*x['passageiros_pagos']+x['carga_paga_kg']+x['correio_kg']+x['bagagem_kg'] )*
-                         x['distancia_voada_km']/(1000*x['decolagens'])) < 1000)
-print('The number of rtk values that correspond to rtk calculation is: {:.2f}%'.format(100*sum(dummy)/len(dummy)))
-df['rtk_calc']=(75*df['passageiros_pagos']+df['carga_paga_kg']+df['correio_kg']+df['bagagem_kg']
-                )*df['distancia_voada_km']/(1000*df['decolagens'])
-
-del dummy
-
-dummy = []
-for index, x in df.iterrows():
-    if x['decolagens'] == 0:
-        dummy.append(abs(x['atk']) < 1000)
-    else:
-        dummy.append(abs(x['atk'] - x['payload']*x['distancia_voada_km']/(1000*x['decolagens'])) < 1000)
-print('The number of atk values that correspond to atk calculation is: {:.2f}%'.format(100*sum(dummy)/len(dummy)))
-df['atk_calc']=df['payload']*df['distancia_voada_km']/(1000*df['decolagens'])
-
-del dummy
+report = check_consistency(df)
+print_rates(report)
 
 
 # We can see that the consistency is variable, and is specifically lower for RTK values.
@@ -213,27 +159,8 @@ sns.scatterplot(x=df['rtk'],y=df['rtk_calc'],hue=df['empresa_nacionalidade'])
 # In[9]:
 
 
-dummy = []
-rtk_calc = []
-for index, x in df.iterrows():
-    if x['empresa_nacionalidade'] == 'BRASILEIRA':
-        avgw = 75
-    elif x['empresa_nacionalidade'] == 'ESTRANGEIRA':
-        avgw = 90
-        
-    if x['decolagens'] == 0:
-        rtk = float('NaN')
-        dummy.append(abs(x['rtk']) < 1000)
-    else:
-        rtk = (avgw*x['passageiros_pagos']+x['carga_paga_kg']+x['correio_kg']+x['bagagem_kg']
-           )*x['distancia_voada_km']/(1000*x['decolagens'])
-        dummy.append(abs(x['rtk'] - rtk) < 1000)
-    rtk_calc.append(rtk)
-
-print('The number of rtk values that correspond to rtk calculation is: {:.2f}%'.format(100*sum(dummy)/len(dummy)))
-df['rtk_calc'] = rtk_calc
-
-del dummy, rtk_calc, rtk
+report = recalc_rtk(df)
+print_rates(report)
 
 
 # We see now that the match of RTK values passed from 56.28% to 58.93%. Let's also reprint the previous graphic with the corrected calculated RTK.
@@ -247,15 +174,20 @@ sns.scatterplot(x=df['rtk'],y=df['rtk_calc'],hue=df['empresa_nacionalidade'])
 # We can see that the second tendency line is gone, since we have took into consideration its behaviour in our model.
 
 # After the consistency check, let's take a look on how the number of flights has evolved through time in our database flights.
+# 
+# All the charts below are sums over some of the columns, so the data is aggregated only once into a cube (one line per month, airline, origin, destination, nature and flight group) and every chart rolls up from it.
 
 # In[11]:
 
 
-df1 = pd.DataFrame(df.groupby(by=['data','ano']).agg('sum')['decolagens'])
+cube = Cube.from_frame(df)
+topk = TopK(cube)
+
+df1 = cube.rollup(['data', 'ano'], 'decolagens')
 
 df1.reset_index(inplace=True)
-ax = sns.catplot(x='data', y='decolagens', data=df1, kind='bar', hue='ano', height=6, aspect=10/6,
-                 sharey=True)
+ax = catplot(x='data', y='decolagens', data=df1, kind='bar', hue='ano', height=6, aspect=10/6,
+             sharey=True)
 
 ax.set_xticklabels(rotation=90, ha="right")    
 ax.fig.suptitle('# Flights per month')
@@ -268,13 +200,11 @@ ax.fig.suptitle('# Flights per month')
 # In[13]:
 
 
-df2 = pd.DataFrame(df.groupby(by=['aeroporto_de_origem_nome']).agg('sum')['decolagens'])
-df2 = df2.sort_values(by=['decolagens'], ascending=False)
+df2 = topk.top('aeroporto_de_origem_nome', 'decolagens', 20)
 print(df2[:10])
-df2.reset_index(inplace=True)
 
-ax = sns.catplot(x='aeroporto_de_origem_nome', y='decolagens',
-                 data=df2[:20], kind='bar', color='b', sharey=True)
+ax = catplot(x='aeroporto_de_origem_nome', y='decolagens',
+             data=df2[:20], kind='bar', color='b', sharey=True)
 
 ax.set_xticklabels(rotation=90, ha="right")
 ax.fig.suptitle('# Flights per airport')
@@ -283,11 +213,11 @@ ax.fig.suptitle('# Flights per airport')
 # In[14]:
 
 
-df3 = df[df['aeroporto_de_origem_nome']=='GUARULHOS']
-df3 = pd.DataFrame(df3.groupby(by=['data','ano']).agg('sum')['decolagens'])
+df3 = cube.rollup(['data', 'ano'], 'decolagens',
+                  where={'aeroporto_de_origem_nome': 'GUARULHOS'})
 df3.reset_index(inplace=True)
 
-ax = sns.catplot(x='data', y='decolagens', data=df3, kind='bar', hue='ano', height=6, aspect=10/6, sharey=True)
+ax = catplot(x='data', y='decolagens', data=df3, kind='bar', hue='ano', height=6, aspect=10/6, sharey=True)
 
 ax.set_xticklabels(rotation=90, ha="right")
 ax.fig.suptitle('# Flights in Guarulhos airport per month')
@@ -298,14 +228,14 @@ ax.fig.suptitle('# Flights in Guarulhos airport per month')
 # In[15]:
 
 
-df4 = pd.DataFrame(df.groupby(by=['data', 'empresa_nacionalidade']).agg('sum')['decolagens'])
+df4 = cube.rollup(['data', 'empresa_nacionalidade'], 'decolagens')
 
 df4[df4.index.isin(['ESTRANGEIRA'],level=1)]['decolagens'].values
 
 df4.reset_index(inplace=True)
 
-ax = sns.catplot(x='data', y='decolagens',
-                 data=df4, kind='bar', hue='empresa_nacionalidade', height=6, aspect=10/6, sharey=True)
+ax = catplot(x='data', y='decolagens',
+             data=df4, kind='bar', hue='empresa_nacionalidade', height=6, aspect=10/6, sharey=True)
 
 ax.set_xticklabels(rotation=90, ha="right")
 ax.fig.suptitle('# Flights per Month - Brazilian and Foreign Airlines')
@@ -318,12 +248,10 @@ ax.fig.suptitle('# Flights per Month - Brazilian and Foreign Airlines')
 # In[16]:
 
 
-df5 = pd.DataFrame(df.groupby(by=['rota_nome']).agg('sum')['decolagens'])
-df5 = df5.sort_values(by=['decolagens'], ascending=False)
-df5.reset_index(inplace=True)
+df5 = topk.top('rota_nome', 'decolagens', 20)
 
-ax = sns.catplot(x='rota_nome', y='decolagens',
-                 data=df5[:20], kind='bar', color='b', height=6, aspect=10/6, sharey=True)
+ax = catplot(x='rota_nome', y='decolagens',
+             data=df5[:20], kind='bar', color='b', height=6, aspect=10/6, sharey=True)
 
 ax.set_xticklabels(rotation=90, ha="right")
 ax.fig.suptitle('# Flights per route')
@@ -331,6 +259,16 @@ ax.fig.suptitle('# Flights per route')
 
 # We can see that even though Guarulhos (São Paulo international airport) is the busiest airport per number of flights in Brazil, it is not present in the Top 2 routes, which are between Rio de Janeiro and São Paulo local airports. Guarulhos, however is present in 10 of the Top 20 routes, which shows its relevancy as a national and international hub.
 
+# Its role as a hub can be measured on the route graph: the share of the takeoffs of the routes each airport is on, and its eigenvector centrality.
+
+# In[ ]:
+
+
+routes = RouteIndex(cube)
+print(pd.concat([routes.centrality(kind='strength'),
+                 routes.centrality(kind='eigenvector')], axis=1)
+      .join(routes.names)[:10])
+
 # Let's now observe the temporal effect on the top 5 routes (per number of flights) in this dataframe:
 
 # In[17]:
@@ -342,12 +280,10 @@ toproutes = df5['rota_nome'][:5]
 # In[18]:
 
 
-df6 = pd.DataFrame(df[df['rota_nome'].isin(list(toproutes))]
-                   .groupby(by=['data', 'rota_nome'])
-                   .agg('sum')['decolagens'])
+df6 = topk.series('rota_nome', toproutes, 'decolagens')
 df6.reset_index(inplace=True)
 
-ax = sns.catplot(x='data', y='decolagens', #height=6, aspect=10/6, #hue='rota (nome)',  
+ax = catplot(x='data', y='decolagens', #height=6, aspect=10/6, #hue='rota (nome)',  
             col='rota_nome', data=df6, kind='bar', col_wrap=2,
             sharey=True)
 
@@ -360,16 +296,11 @@ ax.set_xticklabels(rotation=90, ha="right")
 # In[28]:
 
 
-df7 = pd.DataFrame(df.groupby(by=['rota_nome', 'empresa_nacionalidade'])
-                   .agg('sum')['rpk'])
+df7 = topk.top(['rota_nome', 'empresa_nacionalidade'], 'rpk', 20)
 
-df7 = df7.sort_values(by=['rpk'], ascending=False)
-
-df7.reset_index(inplace=True)
-
-ax = sns.catplot(x='rota_nome', y='rpk', #hue='rota_nome', col='empresa_nacionalidade',
-                 data=df7[0:20], kind='bar', color='b', #col_wrap=2,
-                 sharey=True)
+ax = catplot(x='rota_nome', y='rpk', #hue='rota_nome', col='empresa_nacionalidade',
+             data=df7[0:20], kind='bar', color='b', #col_wrap=2,
+             sharey=True)
 
 ax.set_xticklabels(rotation=90, ha="right")
 ax.fig.suptitle('RPK per route')
@@ -382,30 +313,31 @@ toprpkroutes = df7['rota_nome'].loc[:19]
 # In[29]:
 
 
-df8 = pd.DataFrame(df[df['rota_nome'].isin(list(toprpkroutes))]
-                    .groupby(by=['rota_nome', 
-                                 'data']).agg(
-                                       rpk=pd.NamedAgg('rpk','mean'),
-                                       decolagens=pd.NamedAgg('decolagens','sum')
-                                       ))
-df8.reset_index(inplace=True) 
+df8 = topk.series('rota_nome', toprpkroutes, ['rpk', 'decolagens'])
+df8.reset_index(inplace=True)
 
-ax = sns.catplot(x='data', y='rpk', #hue='decolagens',
-                 col='rota_nome',
-                 data=df8, kind='bar', col_wrap=3,
-                 sharey=True, height=6, aspect=1)
+ax = catplot(x='data', y='rpk', #hue='decolagens',
+             col='rota_nome',
+             data=df8, kind='bar', col_wrap=3,
+             sharey=True, height=6, aspect=1)
 
 ax.set_xticklabels(rotation=90, ha="right")
 ax.fig.suptitle('RPK per month - route')
 
 
+# And the load factor of those routes per month, as sum of RPK / sum of ASK.
+
 # In[25]:
 
 
-ax = sns.catplot(x='data', y='load_factor', #hue='decolagens',
-                 col='rota_nome',
-                 data=df9, kind='bar', col_wrap=2,
-                 sharey=True, height=6, aspect=1)
+df9 = rollup_load_factor(cube, ['rota_nome', 'data'],
+                         where={'rota_nome': list(toprpkroutes)})
+df9.reset_index(inplace=True)
+
+ax = catplot(x='data', y='load_factor', #hue='decolagens',
+             col='rota_nome',
+             data=df9, kind='bar', col_wrap=2,
+             sharey=True, height=6, aspect=1)
 
 ax.set_xticklabels(rotation=90, ha="right")
 
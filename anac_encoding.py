@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent integer encoding of the categorical columns.
+
+A CategoryEncoder holds a fixed vocabulary per column: a value's code is
+its position in the vocabulary, so the same value gets the same code in
+every run that uses the same encoder. update() appends the values it has
+not seen to the end of the vocabularies (existing codes never change) and
+bumps the version; transform() gives unseen values the code `unseen`
+and missing values the code `missing` (-1 for both by default).
+Encoders are saved as JSON and stored inside the model bundles of
+anac_models.save_model.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+ENCODER_FORMAT = 1
+
+# categorical columns of the data_transform features
+CATEGORICAL = ['empresa_nacionalidade', 'natureza']
+
+
+def _values(s):
+    return s.dropna().unique().tolist()
+
+
+class CategoryEncoder:
+    """Fixed vocabularies ({column: [values]}) and their version."""
+
+    def __init__(self, vocabularies, version=1):
+        self.vocabularies = {c: list(v) for c, v in vocabularies.items()}
+        self.version = version
+        self._index = {c: pd.Index(v) for c, v in self.vocabularies.items()}
+
+    @classmethod
+    def fit(cls, df, columns=CATEGORICAL):
+        """Encoder with the sorted values of the given columns of df."""
+        return cls({c: sorted(_values(df[c])) for c in columns})
+
+    def update(self, df):
+        """Encoder that also knows the values of df it has not seen, with
+        the version bumped if any was added (self if none)."""
+        vocabularies = {}
+        for col, vocab in self.vocabularies.items():
+            values = _values(df[col])
+            new = self._index[col].get_indexer(values) < 0
+            vocabularies[col] = vocab + sorted(
+                v for v, n in zip(values, new) if n)
+        if vocabularies == self.vocabularies:
+            return self
+        return CategoryEncoder(vocabularies, self.version + 1)
+
+    def codes(self, values, column, unseen=-1, missing=-1):
+        """Codes of values (a Series) in the vocabulary of column, unseen
+        for unseen values and missing for missing ones."""
+        vocab = self._index[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # look up the categories only, then take their codes; the
+            # code -1 of missing values takes the last, padding entry
+            lookup = np.append(vocab.get_indexer(values.cat.categories), -1)
+            raw = values.cat.codes.to_numpy()
+            codes = lookup[raw]
+            isna = raw < 0
+        else:
+            codes = vocab.get_indexer(values)
+            isna = values.isna().to_numpy()
+        if unseen == -1 and missing == -1:
+            return codes
+        return np.where(isna, missing, np.where(codes >= 0, codes, unseen))
+
+    def transform(self, df, unseen=-1, missing=-1):
+        """Copy of df with the encoded columns replaced by their codes."""
+        return df.assign(**{c: self.codes(df[c], c, unseen, missing)
+                            for c in self.vocabularies if c in df.columns})
+
+    def inverse(self, codes, column):
+        """Values of the codes of column (NaN for codes out of range)."""
+        vocab = np.asarray(self.vocabularies[column] + [np.nan],
+                           dtype=object)
+        codes = np.asarray(codes)
+        valid = (codes >= 0) & (codes < len(vocab) - 1)
+        return vocab[np.where(valid, codes, -1).astype(np.int64)]
+
+    def to_dict(self):
+        return {'format': ENCODER_FORMAT, 'version': self.version,
+                'vocabularies': self.vocabularies}
+
+    @classmethod
+    def from_dict(cls, d):
+        if d.get('format') != ENCODER_FORMAT:
+            raise ValueError('unsupported encoder format: {}'.format(
+                d.get('format')))
+        return cls(d['vocabularies'], d['version'])
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=1, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def load_or_fit(path, df, columns=CATEGORICAL):
+    """The encoder saved at path, updated with the values of df and saved
+    again if that added any; a new encoder fitted on df if there is none
+    yet."""
+    if os.path.exists(path):
+        encoder = CategoryEncoder.load(path)
+        updated = encoder.update(df)
+        if updated is encoder:
+            return encoder
+    else:
+        updated = CategoryEncoder.fit(df, columns)
+    updated.save(path)
+    return updated
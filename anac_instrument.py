@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Stage instrumentation of the ANAC scripts.
+
+An Instrument records, for each stage run under `with inst.stage(name)`,
+the wall time, the CPU time (of this process and of the worker processes
+that finished during the stage), the rows processed, the rows per second
+and the peak resident memory. The records are exported as JSON or CSV,
+one line per stage with the time of the run, so files written by
+successive runs can be compared to catch regressions:
+
+    inst = Instrument()
+    with inst.stage('load') as s:
+        df = load_anac(folder, files)
+        s.rows = len(df)
+    inst.to_csv('metrics.csv', append=True)
+
+The peak memory is sampled every `interval` seconds with psutil; without
+psutil it is the peak of the whole process so far (resource module, not
+on Windows) or None.
+
+Stages listed in `profile` are also run under a sampling profiler: any
+object with start(stage) and stop(stage) methods, by default a
+StackSampler writing the Python stacks it sees in the collapsed format
+of flamegraph.pl and speedscope.
+"""
+
+import collections
+import json
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:  # peak memory falls back to the resource module
+    psutil = None
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# seconds between two memory (and stack) samples
+INTERVAL = 0.01
+
+StageMetrics = namedtuple('StageMetrics', ['run', 'stage', 'wall', 'cpu',
+                                           'rows', 'rows_per_s',
+                                           'peak_rss'])
+
+
+def _cpu_time():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def _rss():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    return None
+
+
+class _Sampler(threading.Thread):
+    """Thread calling sample() every interval seconds until stopped."""
+
+    def __init__(self, sample, interval):
+        super().__init__(daemon=True)
+        self.sample = sample
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class _Record:
+    """What a stage reports about itself (the rows it processed)."""
+
+    def __init__(self):
+        self.rows = None
+
+
+class StackSampler:
+    """Sampling profiler of the thread that starts it. Each stage's stacks
+    are counted in memory and written to out_dir/<stage>.folded."""
+
+    def __init__(self, out_dir, interval=INTERVAL):
+        self.out_dir = out_dir
+        self.interval = interval
+        self._sampler = None
+
+    def _sample(self):
+        frame = sys._current_frames().get(self._thread)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('{} ({}:{})'.format(
+                code.co_name, os.path.basename(code.co_filename),
+                code.co_firstlineno))
+            frame = frame.f_back
+        if stack:
+            self._counts[';'.join(reversed(stack))] += 1
+
+    def start(self, stage):
+        self._thread = threading.get_ident()
+        self._counts = collections.Counter()
+        self._sampler = _Sampler(self._sample, self.interval)
+        self._sampler.start()
+
+    def stop(self, stage):
+        self._sampler.stop()
+        os.makedirs(self.out_dir, exist_ok=True)
+        with open(os.path.join(self.out_dir, stage + '.folded'), 'w') as f:
+            for stack, count in self._counts.most_common():
+                f.write('{} {}\n'.format(stack, count))
+
+
+class Instrument:
+    """Metrics of the stages of a run."""
+
+    def __init__(self, profile=(), profiler=None, interval=INTERVAL):
+        self.run = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.profile = set(profile)
+        self.profiler = profiler
+        if self.profile and profiler is None:
+            self.profiler = StackSampler('profiles')
+        self.interval = interval
+        self.metrics = []
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Measure the block as stage name. Yields a record whose rows
+        attribute (default: rows) the block can set."""
+        record = _Record()
+        record.rows = rows
+        peak = [_rss()]
+        sampler = None
+        if psutil is not None:
+            def sample():
+                peak[0] = max(peak[0], _rss())
+            sampler = _Sampler(sample, self.interval)
+            sampler.start()
+        profiled = name in self.profile
+        if profiled:
+            self.profiler.start(name)
+        cpu, wall = _cpu_time(), time.perf_counter()
+        try:
+            yield record
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = _cpu_time() - cpu
+            if profiled:
+                self.profiler.stop(name)
+            if sampler is not None:
+                sampler.stop()
+            end = _rss()
+            if peak[0] is not None and end is not None:
+                peak[0] = max(peak[0], end)
+            rows = record.rows
+            self.metrics.append(StageMetrics(
+                self.run, name, wall, cpu, rows,
+                rows / wall if rows is not None and wall > 0 else None,
+                peak[0]))
+
+    def frame(self):
+        frame = pd.DataFrame(self.metrics, columns=StageMetrics._fields)
+        return frame.astype({'rows': 'Int64', 'rows_per_s': 'float64',
+                             'peak_rss': 'Int64'})
+
+    def to_json(self, path):
+        """Write the metrics as a JSON list of records."""
+        with open(path, 'w') as f:
+            json.dump([m._asdict() for m in self.metrics], f, indent=1)
+
+    def to_csv(self, path, append=False):
+        """Write the metrics as CSV; with append they are added to the
+        records of the previous runs already in path."""
+        header = not (append and os.path.exists(path))
+        self.frame().to_csv(path, mode='a' if append else 'w',
+                            header=header, index=False)
+
+    def export(self, path, append=False):
+        """to_json or to_csv, by the extension of path."""
+        if path.endswith('.json'):
+            self.to_json(path)
+        else:
+            self.to_csv(path, append)
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""
+Loader for the ANAC resumo_anual_*.csv files.
+
+The raw CSVs are parsed once, the column names are converted to snake_case
+and the result is stored as a compressed Feather (Arrow IPC) file per source
+CSV. Later runs memory-map the cached files instead of parsing the CSVs again.
+A cache entry is reused while the source file keeps the same size and mtime;
+if only the mtime changed, the file hash decides.
+
+The columns are read with a compact schema (see CATEGORY_COLUMNS and the
+lists after it): categoricals for the text columns, signed integers for
+the keys and counts and float32 for horas_voadas, which ANAC writes with a
+decimal comma.
+"""
+
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import unidecode
+
+from anac_derive import concat_frames, observed_categories
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # no pyarrow: always parse the CSVs
+    feather = None
+
+DEFAULT_FOLDER = r'C:\Users\thiag\data\ANAC-transport'
+
+DEFAULT_FILES = ['resumo_anual_2019.csv',
+                 'resumo_anual_2020.csv',
+                 'resumo_anual_2021.csv']
+
+CACHE_DIRNAME = '.anac_cache'
+CACHE_VERSION = 3
+MANIFEST = 'manifest.json'
+
+# with several workers, files larger than this are parsed in byte ranges
+RANGE_BYTES = 256 << 20
+
+# Schema of the renamed columns. Text columns are read as categoricals,
+# ano and mes as int32 and the counts as nullable Int64 (ANAC leaves some
+# of them empty): narrower or unsigned types would wrap around silently in
+# the scripts' arithmetic (90 * passageiros_pagos in UInt16).
+# RPK/ASK/RTK/ATK and the tonne-km columns stay float64 (the consistency
+# check needs their precision) and horas_voadas is parsed with a decimal
+# comma into float32.
+CATEGORY_COLUMNS = [
+    'empresa_sigla', 'empresa_nome', 'empresa_nacionalidade',
+    'aeroporto_de_origem_sigla', 'aeroporto_de_origem_nome',
+    'aeroporto_de_origem_uf', 'aeroporto_de_origem_regiao',
+    'aeroporto_de_origem_pais', 'aeroporto_de_origem_continente',
+    'aeroporto_de_destino_sigla', 'aeroporto_de_destino_nome',
+    'aeroporto_de_destino_uf', 'aeroporto_de_destino_regiao',
+    'aeroporto_de_destino_pais', 'aeroporto_de_destino_continente',
+    'natureza', 'grupo_de_voo']
+KEY_COLUMNS = ['ano', 'mes']
+COUNT_COLUMNS = [
+    'passageiros_pagos', 'passageiros_gratis', 'carga_paga_kg',
+    'carga_gratis_kg', 'correio_kg', 'combustivel_litros',
+    'distancia_voada_km', 'decolagens', 'assentos', 'payload', 'bagagem_kg']
+FLOAT64_COLUMNS = ['ask', 'rpk', 'atk', 'rtk', 'carga_paga_km',
+                   'carga_gratis_km', 'correio_km']
+FLOAT32_COLUMNS = ['horas_voadas']
+
+# (largest value, numpy type, nullable pandas type); the keys take the
+# narrowest that holds them, the counts always the widest
+INT_TYPES = [(np.iinfo(np.int32).max, np.int32, 'Int32'),
+             (np.iinfo(np.int64).max, np.int64, 'Int64')]
+
+
+def snake_case(name):
+    """Convert an ANAC column name to snake_case, e.g.
+    'AEROPORTO DE ORIGEM (SIGLA)' -> 'aeroporto_de_origem_sigla'."""
+    return (unidecode.unidecode(name.lower())
+            .replace(' ', '_')
+            .replace('(', '')
+            .replace(')', ''))
+
+
+def _read_dtype(name):
+    if name in CATEGORY_COLUMNS:
+        return 'category'
+    if name in KEY_COLUMNS or name in COUNT_COLUMNS \
+            or name in FLOAT64_COLUMNS:
+        return np.float64
+    if name in FLOAT32_COLUMNS:
+        return np.float32
+    return None
+
+
+def read_options(path):
+    """Keyword arguments for pd.read_csv on a resumo_anual file."""
+    header = pd.read_csv(path, sep=';', encoding='ISO-8859-1', nrows=0)
+    dtype = {}
+    for raw in header.columns:
+        t = _read_dtype(snake_case(raw))
+        if t is not None:
+            dtype[raw] = t
+    return {'sep': ';', 'encoding': 'ISO-8859-1', 'decimal': ',',
+            'dtype': dtype}
+
+
+def _as_int(s, nullable, types=INT_TYPES):
+    """s as the first of types that holds its values, or unchanged when
+    they are not all integers (or, without nullable, when some are
+    missing)."""
+    values = s.to_numpy(dtype=np.float64, na_value=np.nan)
+    missing = np.isnan(values)
+    present = values[~missing]
+    if (present != np.floor(present)).any():
+        return s
+    if missing.any() and not nullable:
+        return s
+    top = np.abs(present).max() if len(present) else 0
+    for limit, numpy_type, pandas_type in types:
+        if top <= limit:
+            return s.astype(pandas_type if nullable else numpy_type)
+    return s
+
+
+def apply_schema(df):
+    """Convert the integer columns of a frame read with read_options."""
+    for col in KEY_COLUMNS:
+        if col in df.columns:
+            df[col] = _as_int(df[col], nullable=False)
+    for col in COUNT_COLUMNS:
+        if col in df.columns:
+            df[col] = _as_int(df[col], nullable=True, types=INT_TYPES[1:])
+    return df
+
+
+def read_resumo(path):
+    """Parse a single resumo_anual CSV, rename its columns and apply the
+    column schema."""
+    df = pd.read_csv(path, **read_options(path))
+    df.columns = [snake_case(z) for z in df.columns]
+    return apply_schema(df)
+
+
+def byte_ranges(path, range_bytes=RANGE_BYTES):
+    """Split the rows of a CSV file in (start, end) byte ranges of about
+    range_bytes each, cut at line ends. The header line is left out."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        bounds = [len(f.readline())]
+        while bounds[-1] + range_bytes < size:
+            f.seek(bounds[-1] + range_bytes)
+            f.readline()
+            if f.tell() >= size:
+                break
+            bounds.append(f.tell())
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def read_range(path, start, end):
+    """Parse the rows between two byte offsets of a resumo_anual CSV (see
+    byte_ranges) like read_resumo does."""
+    with open(path, 'rb') as f:
+        header = f.readline()
+        f.seek(start)
+        data = f.read(end - start)
+    df = pd.read_csv(io.BytesIO(header + data), **read_options(path))
+    df.columns = [snake_case(z) for z in df.columns]
+    return apply_schema(df)
+
+
+def file_hash(path, blocksize=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _cache_name(filename):
+    return os.path.splitext(os.path.basename(filename))[0] + '.feather'
+
+
+def read_manifest(directory, version, key):
+    """The key entries of the manifest in directory ({} if there is none,
+    or if it was written with another version)."""
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != version:
+        return {}
+    return manifest.get(key, {})
+
+
+def write_manifest(directory, version, key, entries):
+    """Replace the manifest in directory with entries under key."""
+    tmp = os.path.join(directory, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump({'version': version, key: entries}, f, indent=1,
+                  sort_keys=True)
+    os.replace(tmp, os.path.join(directory, MANIFEST))
+
+
+def _is_fresh(path, entry, cache_dir):
+    """Check a manifest entry against the source file. Returns (fresh,
+    entry), where entry may have been refreshed with the new mtime."""
+    if not entry or not os.path.exists(os.path.join(cache_dir,
+                                                    entry['cache'])):
+        return False, entry
+    st = os.stat(path)
+    if st.st_size != entry['size']:
+        return False, entry
+    if st.st_mtime_ns == entry['mtime_ns']:
+        return True, entry
+    # same size, different mtime (copied or touched): let the hash decide
+    if file_hash(path) == entry['sha1']:
+        entry = dict(entry, mtime_ns=st.st_mtime_ns)
+        return True, entry
+    return False, entry
+
+
+def _store(df, path, cache_dir, compression):
+    st = os.stat(path)
+    name = _cache_name(path)
+    tmp = os.path.join(cache_dir, name + '.tmp')
+    feather.write_feather(df.reset_index(drop=True), tmp,
+                          compression=compression)
+    os.replace(tmp, os.path.join(cache_dir, name))
+    return {'cache': name, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+            'sha1': file_hash(path), 'rows': len(df)}
+
+
+def restore_missing(df):
+    """Arrow gives missing strings back as None; read_csv uses NaN."""
+    for col in df.select_dtypes(object).columns:
+        missing = df[col].isna()
+        if missing.any():
+            df.loc[missing, col] = np.nan
+
+
+def _parse(task):
+    """Parse a file or a byte range of a file, on a worker process. Whole
+    files are cached there too; returns (frame, manifest entry or None)."""
+    path, rng, cache_dir, compression = task
+    if rng is not None:
+        return read_range(path, *rng), None
+    df = read_resumo(path)
+    if cache_dir is None:
+        return df, None
+    return df, _store(df, path, cache_dir, compression)
+
+
+def _assemble(parts):
+    """Concatenate frames with the same columns one column at a time. Each
+    column of the parts is released once it has been copied, so the peak
+    memory stays close to one copy of the data instead of two. parts is
+    emptied."""
+    if not parts:
+        return pd.DataFrame()
+    if len({tuple(p.columns) for p in parts}) > 1:
+        df = concat_frames(parts)
+        parts.clear()
+        return df
+    columns = list(parts[0].columns)
+    pieces = [dict(p.items()) for p in parts]
+    parts.clear()
+    out = {}
+    for col in columns:
+        cols = [p.pop(col) for p in pieces]
+        if all(isinstance(c.dtype, pd.CategoricalDtype) for c in cols):
+            out[col] = pd.Series(pd.api.types.union_categoricals(
+                cols, sort_categories=True))
+        else:
+            out[col] = pd.concat(cols, ignore_index=True)
+        del cols
+    return pd.DataFrame(out, columns=columns, copy=False)
+
+
+def load_anac(folder=DEFAULT_FOLDER, files=DEFAULT_FILES, cache_dir=None,
+              use_cache=True, compression='lz4', workers=1,
+              range_bytes=RANGE_BYTES):
+    """Load and concatenate the given resumo_anual files from folder.
+
+    The columns come back already in snake_case. With use_cache the parsed
+    files are kept under cache_dir (default: folder/.anac_cache). Pass
+    compression='uncompressed' for zero-copy memory mapping at the cost of
+    a larger cache.
+
+    The files that have to be parsed are parsed on a pool of workers
+    processes (None: one per CPU), the ones larger than range_bytes in byte
+    ranges. Scripts that use workers > 1 must call load_anac under
+    if __name__ == '__main__' on Windows.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(folder, CACHE_DIRNAME)
+    if feather is None:
+        use_cache = False
+    if workers is None:
+        workers = os.cpu_count() or 1
+    paths = [os.path.join(folder, x) for x in files]
+    entries = {}
+    if use_cache:
+        os.makedirs(cache_dir, exist_ok=True)
+        entries = read_manifest(cache_dir, CACHE_VERSION, 'files')
+
+    # parts[i]: cached frame of paths[i], or the positions in tasks of the
+    # tasks that parse it
+    parts = []
+    tasks = []
+    for path in paths:
+        key = os.path.basename(path)
+        if use_cache:
+            fresh, entry = _is_fresh(path, entries.get(key), cache_dir)
+            if fresh:
+                df = feather.read_feather(
+                    os.path.join(cache_dir, entry['cache']), memory_map=True)
+                restore_missing(df)
+                parts.append(df)
+                entries[key] = entry
+                continue
+        if workers > 1 and os.path.getsize(path) > range_bytes:
+            ranges = byte_ranges(path, range_bytes)
+        else:
+            ranges = [None]
+        parts.append(list(range(len(tasks), len(tasks) + len(ranges))))
+        tasks.extend((path, r, cache_dir if use_cache and r is None
+                      else None, compression) for r in ranges)
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(min(workers, len(tasks))) as pool:
+            results = list(pool.map(_parse, tasks))
+    else:
+        results = [_parse(t) for t in tasks]
+
+    frames = []
+    parsed = []  # (path, first row, end row, entry) of the parsed files
+    rows = 0
+    for path, part in zip(paths, parts):
+        if isinstance(part, list):
+            dfs = [results[i][0] for i in part]
+            n = sum(len(d) for d in dfs)
+            parsed.append((path, rows, rows + n, results[part[0]][1]))
+        else:
+            dfs = [part]
+            n = len(part)
+        frames.extend(dfs)
+        rows += n
+    del results, parts
+    df = _assemble(frames)
+
+    if use_cache:
+        stored = read_manifest(cache_dir, CACHE_VERSION, 'files')
+        for path, start, end, entry in parsed:
+            if entry is None:  # parsed in byte ranges
+                entry = _store(observed_categories(df.iloc[start:end]), path,
+                               cache_dir, compression)
+            entries[os.path.basename(path)] = entry
+        if entries != stored:
+            write_manifest(cache_dir, CACHE_VERSION, 'files', entries)
+    return df
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Load factor (RPK / ASK) of rows and of cube rollups.
+
+The load factor of a group is the ratio of its sums (sum of RPK / sum of
+ASK), weighted by the offered capacity, never the mean of its row-level
+ratios. The same edge-case rules apply at every level, as array masks:
+
+- no ASK (ask == 0): the load factor is 0, as in findingASK.py;
+- more RPK than ASK (inconsistent distances): the load factor is paid
+  passengers / seats instead;
+- otherwise RPK / ASK (NaN if either is missing).
+
+A sum skips the missing values, so the sum of RPK of a group would count
+rows whose ASK is missing. Each ratio only uses the rows that have both
+of its values: the PAIRED columns (rpk_lf, ask_lf, passageiros_pagos_lf,
+assentos_lf) are the COLUMNS with NaN where the other value of the pair
+(RPK and ASK, passengers and seats) is missing, and are the measures the
+cube sums for the load factor.
+"""
+
+import numpy as np
+import pandas as pd
+
+from anac_consistency import float_values
+
+# columns the rules need: RPK, ASK, paid passengers, seats
+COLUMNS = ['rpk', 'ask', 'passageiros_pagos', 'assentos']
+# numerator and denominator of each ratio
+PAIRS = [('rpk', 'ask'), ('passageiros_pagos', 'assentos')]
+# the COLUMNS restricted to the rows with both values of their pair
+PAIRED = [c + '_lf' for c in COLUMNS]
+
+
+def load_factor(rpk, ask, pax, seats):
+    """Load factor of aligned float arrays, with the edge-case rules."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = rpk / ask
+        fallback = np.where(seats > 0, pax / seats, np.nan)
+    out = np.where(rpk > ask, fallback, out)
+    return np.where(ask == 0, 0., out)
+
+
+def paired_columns(df):
+    """Dict with the PAIRED arrays of a row-level frame ({} if it lacks
+    any of the COLUMNS)."""
+    if any(c not in df.columns for c in COLUMNS):
+        return {}
+    out = {}
+    for num, den in PAIRS:
+        num_values = float_values(df, num)
+        den_values = float_values(df, den)
+        both = ~(np.isnan(num_values) | np.isnan(den_values))
+        out[num + '_lf'] = np.where(both, num_values, np.nan)
+        out[den + '_lf'] = np.where(both, den_values, np.nan)
+    return out
+
+
+def frame_load_factor(df):
+    """Series with the load factor of every row of a frame with the
+    COLUMNS (row-level data) or of the sums of the PAIRED columns
+    (rolled-up data)."""
+    cols = PAIRED if all(c in df.columns for c in PAIRED) else COLUMNS
+    return pd.Series(load_factor(*(float_values(df, c) for c in cols)),
+                     index=df.index, name='load_factor')
+
+
+def rollup_load_factor(cube, by, where=None):
+    """Frame indexed by the dimensions in by with the summed COLUMNS and
+    the load factor of the sums of the PAIRED columns (of the COLUMNS for
+    cubes built without them)."""
+    paired = [c for c in PAIRED if c in cube.measures]
+    if len(paired) < len(PAIRED):
+        paired = []
+    sums = cube.rollup(by, COLUMNS + paired, where=where)
+    sums['load_factor'] = frame_load_factor(sums)
+    return sums.drop(columns=paired)
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of candidate regressors.
+
+benchmark_models cross-validates each model, in this process or, with
+workers > 1 or a time budget, each in its own process up to `workers` at
+a time; only then is a model stopped once it has run for time_budget
+seconds (a model running in this process cannot be stopped). For every
+fold it records the fit time, the predict time, the peak memory
+allocated by the fit and the predictions (traced with tracemalloc) and
+the held-out score. The result is one row per model, the models that
+completed every fold first:
+
+    model            name of the model
+    status           'ok', 'timeout' or the error raised by the model
+    folds            number of folds completed
+    fit_s            mean fit time per fold (s)
+    predict_s        mean predict time per fold (s)
+    predict_us_row   mean predict time per row (microseconds)
+    peak_mb          highest peak memory over the folds (MB)
+    score            mean held-out score (R^2 by default)
+    score_std        its standard deviation over the folds
+
+best_model picks the best model that completed its folds, provided it
+scores above the BASELINE (the mean of the target) and, optionally,
+predicts within a latency budget.
+
+With worker processes, scripts that call it must be protected by
+if __name__ == '__main__' where processes are spawned (Windows, macOS).
+
+tune_regressor searches the hyper-parameters of a scaled regressor (an
+MLPRegressor by default) with successive halving on a pool of workers.
+The scaling stage is cached with joblib.Memory, so fits that see the same
+data reuse it, and save_model/load_model persist the best model with the
+features and target it was fitted on; predict applies it to the same
+columns of a frame.
+"""
+
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import time
+import tracemalloc
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn import linear_model, svm
+from sklearn.base import clone
+from sklearn.compose import TransformedTargetRegressor
+from sklearn.dummy import DummyRegressor
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.metrics import r2_score
+from sklearn.model_selection import HalvingGridSearchCV, KFold
+from sklearn.neural_network import MLPRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+TIME_BUDGET = 300
+MODEL_VERSION = 1
+
+# inputs of the RTK/ATK regressors in findingASK.py
+FEATURES = ['passageiros_pagos', 'carga_paga_kg', 'distancia_voada_km',
+            'decolagens', 'bagagem_kg']
+
+# MLPRegressor parameters tried by tune_regressor
+MLP_GRID = {'hidden_layer_sizes': [(50,), (100,), (100, 50)],
+            'alpha': [1e-4, 1e-3, 1e-2],
+            'learning_rate_init': [1e-3, 1e-2]}
+
+# predicts the mean: a model that does not score above it is not kept
+BASELINE = 'DummyRegressor'
+
+RESULT_COLUMNS = ['model', 'status', 'folds', 'fit_s', 'predict_s',
+                  'predict_us_row', 'peak_mb', 'score', 'score_std']
+
+
+def default_regressors():
+    """The regressors compared in anac_fuzzyc.py, by name, each after the
+    scaling of scaled_regressor, and the BASELINE they have to beat."""
+    models = {
+        'SVR': svm.SVR(),
+        'SGDRegressor': linear_model.SGDRegressor(),
+        'BayesianRidge': linear_model.BayesianRidge(),
+        'LassoLars': linear_model.LassoLars(),
+        'ARDRegression': linear_model.ARDRegression(),
+        'PassiveAggressiveRegressor':
+            linear_model.PassiveAggressiveRegressor(),
+        'TheilSenRegressor': linear_model.TheilSenRegressor(),
+        'LinearRegression': linear_model.LinearRegression()}
+    models = {name: scaled_regressor(model) for name, model in models.items()}
+    models[BASELINE] = DummyRegressor()
+    return models
+
+
+def _run_folds(name, model, X, y, folds, metric, out):
+    """Cross-validate model, putting one message per fold in out."""
+    try:
+        for train, test in folds:
+            est = clone(model)
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            est.fit(X[train], y[train])
+            t1 = time.perf_counter()
+            pred = est.predict(X[test])
+            t2 = time.perf_counter()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            out.put((name, 'fold', (t1 - t0, t2 - t1, len(test), peak,
+                                    metric(y[test], pred))))
+    except Exception as e:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        out.put((name, 'error', '{}: {}'.format(type(e).__name__, e)))
+    else:
+        out.put((name, 'done', None))
+
+
+def _summary(name, status, folds):
+    row = dict.fromkeys(RESULT_COLUMNS, np.nan)
+    row.update(model=name, status=status, folds=len(folds))
+    if folds:
+        fit, predict, rows, peak, score = map(np.array, zip(*folds))
+        row.update(fit_s=fit.mean(), predict_s=predict.mean(),
+                   predict_us_row=1e6 * predict.sum() / rows.sum(),
+                   peak_mb=peak.max() / 2 ** 20, score=score.mean(),
+                   score_std=score.std())
+    return row
+
+
+def _record(message, done, status):
+    name, kind, value = message
+    if kind == 'fold':
+        done[name].append(value)
+    else:
+        status[name] = 'ok' if kind == 'done' else value
+
+
+def _run_in_process(models, X, y, folds, metric, done, status):
+    for name, model in models.items():
+        messages = queue.Queue()
+        _run_folds(name, model, X, y, folds, metric, messages)
+        while not messages.empty():
+            _record(messages.get(), done, status)
+
+
+class _PipeOut:
+    """The put() of a queue, over the writing end of a model's own pipe."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def put(self, message):
+        self.conn.send(message)
+
+
+def _drain(conn, done, status):
+    """Record the messages waiting on conn. Returns False once the child
+    has closed its end."""
+    try:
+        while conn.poll():
+            _record(conn.recv(), done, status)
+    except EOFError:
+        return False
+    return True
+
+
+def _run_on_processes(models, X, y, folds, metric, time_budget, workers,
+                      done, status):
+    # each model reports on its own pipe, so stopping one with terminate()
+    # cannot corrupt the messages of the others
+    pending = list(models.items())
+    running = {}  # name: (process, reading end, start time)
+    while pending or running:
+        while pending and len(running) < workers:
+            name, model = pending.pop(0)
+            reader, writer = multiprocessing.Pipe(duplex=False)
+            proc = multiprocessing.Process(
+                target=_run_folds,
+                args=(name, model, X, y, folds, metric, _PipeOut(writer)),
+                daemon=True)
+            proc.start()
+            writer.close()
+            running[name] = (proc, reader, time.monotonic())
+        multiprocessing.connection.wait(
+            [reader for _, reader, _ in running.values()], timeout=0.1)
+        for name, (proc, reader, start) in list(running.items()):
+            alive = _drain(reader, done, status)
+            if name in status:
+                proc.join()
+            elif time.monotonic() - start > time_budget:
+                proc.terminate()
+                proc.join()
+                _drain(reader, done, status)
+                status[name] = 'timeout'
+            elif not alive:
+                proc.join()
+                status[name] = 'exit code {}'.format(proc.exitcode)
+            else:
+                continue
+            reader.close()
+            del running[name]
+
+
+def benchmark_models(models, X, y, cv=5, time_budget=None, workers=1,
+                     metric=r2_score, seed=0, out=None):
+    """Cross-validate each model of models ({name: estimator}) on X, y and
+    return the results table (models that completed every fold first, then
+    by score, best first). workers is the number of models run at a time
+    in worker processes (1: one after the other in this process; None: one
+    per CPU). time_budget is the time (s) allowed per model on the worker
+    processes (default TIME_BUDGET); it cannot be given with workers=1,
+    but with workers=None it runs the models on worker processes even on
+    a single CPU. With out, the table is also written there as CSV."""
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if workers == 1 and time_budget is not None:
+        raise ValueError('time_budget needs worker processes: a model run '
+                         'in this process cannot be stopped')
+    folds = list(KFold(cv, shuffle=True, random_state=seed).split(X))
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    done = {name: [] for name in models}
+    status = {}
+    if workers == 1 and time_budget is None:
+        _run_in_process(models, X, y, folds, metric, done, status)
+    else:
+        if time_budget is None:
+            time_budget = TIME_BUDGET
+        _run_on_processes(models, X, y, folds, metric, time_budget, workers,
+                          done, status)
+    table = pd.DataFrame([_summary(name, status[name], done[name])
+                          for name in models], columns=RESULT_COLUMNS)
+    table['ok'] = table['status'] == 'ok'
+    table = table.sort_values(['ok', 'score'], ascending=False,
+                              ignore_index=True).drop(columns='ok')
+    if out is not None:
+        table.to_csv(out, index=False)
+    return table
+
+
+def best_model(results, baseline=BASELINE, max_us_row=None):
+    """Name of the best model of a benchmark_models table that completed
+    its folds, scored above the baseline model and, with max_us_row,
+    predicted within that many microseconds per row; None if there is
+    none."""
+    ok = results[results['status'] == 'ok']
+    floor = ok.loc[ok['model'] == baseline, 'score']
+    if floor.empty:
+        raise ValueError('the baseline {} did not complete its '
+                         'folds'.format(baseline))
+    better = ok[(ok['model'] != baseline) & (ok['score'] > floor.iloc[0])]
+    if max_us_row is not None:
+        better = better[better['predict_us_row'] <= max_us_row]
+    return None if better.empty else better['model'].iloc[0]
+
+
+def model_data(df, target, features=FEATURES):
+    """Features (missing values as 0) and target of the rows of df where
+    the target is known."""
+    rows = df[target].notna().to_numpy()
+    X = df.loc[rows, features].astype(np.float64).fillna(value=0)
+    return X, df.loc[rows, target].astype(np.float64)
+
+
+def scaled_regressor(model=None, memory=None):
+    """model (default: MLPRegressor) after a StandardScaler, with the
+    target standardized too. memory caches the fitted scaler."""
+    if model is None:
+        model = MLPRegressor(random_state=1, max_iter=1000,
+                             early_stopping=True)
+    pipe = Pipeline([('scale', StandardScaler()), ('model', model)],
+                    memory=memory)
+    return TransformedTargetRegressor(regressor=pipe,
+                                      transformer=StandardScaler())
+
+
+def tune_regressor(X, y, param_grid=MLP_GRID, model=None, cache_dir=None,
+                   cv=5, factor=3, workers=None, seed=1):
+    """Successive-halving search of the parameters in param_grid (names of
+    the model's own parameters) for scaled_regressor(model). Returns the
+    fitted HalvingGridSearchCV; its best_estimator_ is refitted on all the
+    rows. X is best a DataFrame, so the model keeps its column names.
+    cache_dir keeps the fitted scaling stages across searches;
+    workers=None uses one process per CPU."""
+    memory = None if cache_dir is None else joblib.Memory(cache_dir,
+                                                          verbose=0)
+    grid = {'regressor__model__' + k: v for k, v in param_grid.items()}
+    search = HalvingGridSearchCV(
+        scaled_regressor(model, memory), grid, cv=cv, factor=factor,
+        n_jobs=-1 if workers is None else workers, random_state=seed)
+    return search.fit(X, np.asarray(y))
+
+
+def _check_features(model, features, what):
+    """Raise ValueError if model was fitted on named columns other than
+    features."""
+    fitted = getattr(model, 'feature_names_in_', None)
+    if fitted is not None and list(fitted) != list(features):
+        raise ValueError('{}: model fitted on {}, not on {}'.format(
+            what, list(fitted), list(features)))
+
+
+def save_model(model, path, features, target, **info):
+    """Persist a fitted model with the features and target it uses."""
+    _check_features(model, features, path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    bundle = dict(info, model=model, features=list(features), target=target,
+                  version=MODEL_VERSION)
+    tmp = path + '.tmp'
+    joblib.dump(bundle, tmp)
+    os.replace(tmp, path)
+
+
+def load_model(path):
+    """The bundle written by save_model: a dict with model, features,
+    target and whatever else was saved with it."""
+    bundle = joblib.load(path)
+    if bundle.get('version') != MODEL_VERSION:
+        raise ValueError('{}: unsupported model version {}'.format(
+            path, bundle.get('version')))
+    _check_features(bundle['model'], bundle['features'], path)
+    return bundle
+
+
+def predict(bundle, df):
+    """Predictions of the model in bundle (see load_model) for the rows of
+    df, from its columns named in the bundle's features."""
+    missing = [c for c in bundle['features'] if c not in df.columns]
+    if missing:
+        raise ValueError('missing features: {}'.format(', '.join(missing)))
+    return bundle['model'].predict(df[bundle['features']])
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Period-over-period comparisons from the cube.
+
+compare() rolls a measure up by some dimensions and a period column (data,
+quarter or ano) and lines every period up with the one lag periods
+before it (12 months or 4 quarters for 'yoy', the previous quarter for
+'qoq', the previous month for 'mom'). The periods are turned into integer
+ordinals and the comparison is a lookup of sorted integer keys, so any
+measure and any dimensions (airport, route, airline, UF, region...) are
+compared in one pass, without pivoting.
+
+Keys that have no value in a period count as 0 there (a route that stopped
+flying shows its full drop); the previous value is NaN only when the
+previous period is outside the data.
+"""
+
+import numpy as np
+import pandas as pd
+
+from anac_cube import as_list
+
+# lag name -> number of periods back, per period column
+LAGS = {'yoy': {'data': 12, 'quarter': 4, 'ano': 1},
+        'qoq': {'quarter': 1, 'data': 3},
+        'mom': {'data': 1}}
+
+COLUMNS = ['current', 'previous', 'delta', 'ratio']
+
+
+def _parse(label, period):
+    if period == 'data':
+        year, month = str(label).split('-')
+        return int(year) * 12 + int(month) - 1
+    if period == 'quarter':
+        year, quarter = str(label).split('-Q')
+        return int(year) * 4 + int(quarter) - 1
+    return int(label)
+
+
+def period_label(ordinal, period):
+    """Label of a period ordinal, as in the data/quarter/ano columns."""
+    if period == 'data':
+        return '{}-{:02}'.format(ordinal // 12, ordinal % 12 + 1)
+    if period == 'quarter':
+        return '{}-Q{}'.format(ordinal // 4, ordinal % 4 + 1)
+    return ordinal
+
+
+def ordinals(values, period):
+    """Integer ordinals of period labels (consecutive periods differ by
+    1); each distinct label is parsed once."""
+    codes, uniques = pd.factorize(values)
+    parsed = np.array([_parse(u, period) for u in uniques], dtype=np.int64)
+    return parsed[codes]
+
+
+def compare(cube, by, measure, period='data', lag='yoy', periods=None,
+            where=None):
+    """measure per key of by and period, with its value lag periods before
+    ('yoy', 'qoq', 'mom' or a number of periods), the delta (current -
+    previous) and the ratio (current / previous). periods restricts the
+    result to some period labels. Returns a frame indexed by by + [period]
+    with the COLUMNS."""
+    by = as_list(by)
+    if not isinstance(lag, int):
+        if period not in LAGS[lag]:
+            raise ValueError('{} does not apply to {}'.format(lag, period))
+        lag = LAGS[lag][period]
+    flat = cube.rollup(by + [period], measure, where=where).reset_index()
+    value = flat[measure].to_numpy(dtype=np.float64, na_value=np.nan)
+    ords = ordinals(flat[period], period)
+    if not len(flat):
+        return pd.DataFrame(columns=by + [period] + COLUMNS).set_index(
+            by + [period])
+    first, last = ords.min(), ords.max()
+    span = last - first + 1
+    if len(by) > 1:
+        group, uniques = pd.MultiIndex.from_frame(flat[by]).factorize()
+    else:
+        group, uniques = pd.Index(flat[by[0]]).factorize()
+    group = group.astype(np.int64)
+
+    # every key with a value, plus the key lag periods after it (a value
+    # that fell to nothing), within the periods of the data
+    key = group * span + (ords - first)
+    later = ords + lag <= last
+    keys = np.unique(np.concatenate([key, key[later] + lag]))
+    order = np.argsort(key)
+    sorted_key, sorted_value = key[order], value[order]
+
+    def lookup(wanted):
+        pos = np.searchsorted(sorted_key, wanted)
+        pos = np.minimum(pos, len(sorted_key) - 1)
+        found = sorted_key[pos] == wanted
+        return np.where(found, sorted_value[pos], 0.)
+
+    out_group, out_ord = keys // span, keys % span + first
+    current = lookup(keys)
+    previous = np.where(out_ord - lag >= first, lookup(keys - lag), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(previous != 0, current / previous, np.nan)
+
+    labels = np.array([period_label(o, period)
+                       for o in range(first, last + 1)], dtype=object)
+    out = uniques[out_group].to_frame(index=False)
+    out.columns = by
+    out[period] = labels[out_ord - first]
+    out['current'] = current
+    out['previous'] = previous
+    out['delta'] = current - previous
+    out['ratio'] = ratio
+    if periods is not None:
+        out = out[out[period].isin(as_list(periods))]
+    return out.set_index(by + [period])
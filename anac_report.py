@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+"""
+Headless report of the ANAC summary data.
+
+    python anac_report.py data_dir out_dir [--files resumo_anual_2021.csv]
+
+The report runs as a pipeline of stages, load -> derive -> check ->
+aggregate -> chart, and writes report.md and report.html to out_dir with
+the consistency rates, the main tables, the charts and the metrics of
+each stage (anac_instrument).
+
+Every stage has a key: a digest of its name, STAGE_VERSION, its parameters
+and the keys of the stages it reads (for load, the names and sha1 hashes
+of the source files, so a file that was only touched or copied counts as
+unchanged; as in the loader's cache, a file is only hashed again when its
+size or mtime changed). The keys of the last run are kept in
+out_dir/.stages/manifest.json, with the outputs of the persisted stages. A
+stage whose key has not changed is not run again: its stored output is
+read back instead, unless the files it lists (the charts) are gone. load
+and derive are not stored (the loader has its own cache); they are skipped
+unless check or aggregate have to run.
+
+By default the report reads every resumo_anual_<year>.csv of data_dir;
+other names, such as the superseded resumo_anual_2021_old.csv, would count
+their months twice and are only read when given with --files.
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import os
+import pickle
+import re
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from anac_charts import FORMATS, chart, facet_charts, render_all
+from anac_consistency import check_consistency
+from anac_cube import Cube
+from anac_derive import add_derived_columns
+from anac_instrument import Instrument, StackSampler
+from anac_loader import file_hash, load_anac, read_manifest, write_manifest
+from anac_loadfactor import rollup_load_factor
+from anac_periods import compare
+from anac_topk import TopK
+from anac_weights import passenger_weights
+
+STAGE_VERSION = 1
+STATE_DIRNAME = '.stages'
+SOURCES = 'sources.json'
+TOP = 20
+FACETS = 20
+# the yearly files read by default
+SOURCE_PATTERN = re.compile(r'resumo_anual_\d{4}\.csv$')
+
+# status: 'ran', 'read' (unchanged, output read back) or 'skipped'
+StageTiming = namedtuple('StageTiming', ['stage', 'status', 'seconds'])
+
+_Stage = namedtuple('_Stage', ['func', 'inputs', 'key', 'persist',
+                               'valid'])
+
+
+def _digest(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True,
+                                   default=str).encode()).hexdigest()
+
+
+def source_key(paths, state_dir):
+    """Key of the source files: their names and sha1 hashes. The hashes
+    are kept in state_dir/SOURCES with the size and mtime of each file and
+    reused while those do not change."""
+    path = os.path.join(state_dir, SOURCES)
+    try:
+        with open(path) as f:
+            known = json.load(f)
+    except (OSError, ValueError):
+        known = {}
+    hashes = {}
+    for p in paths:
+        st = os.stat(p)
+        entry = known.get(os.path.abspath(p))
+        if not entry or entry[:2] != [st.st_size, st.st_mtime_ns]:
+            entry = [st.st_size, st.st_mtime_ns, file_hash(p)]
+        hashes[os.path.abspath(p)] = entry
+    if hashes != known:
+        os.makedirs(state_dir, exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(hashes, f, indent=1, sort_keys=True)
+        os.replace(path + '.tmp', path)
+    return [(os.path.basename(p), hashes[os.path.abspath(p)][2])
+            for p in paths]
+
+
+class Pipeline:
+    """Stages whose outputs are computed on demand and skipped while their
+    keys do not change."""
+
+    def __init__(self, state_dir, force=False, instrument=None):
+        self.state_dir = state_dir
+        self.force = force
+        self.instrument = instrument or Instrument()
+        os.makedirs(state_dir, exist_ok=True)
+        self.keys = read_manifest(state_dir, STAGE_VERSION, 'stages')
+        self.timings = []
+        self._stages = {}
+        self._outputs = {}
+
+    def add(self, name, func, inputs=(), params=None, persist=True,
+            valid=None):
+        """Add a stage computing func(*outputs of inputs). valid(output)
+        tells whether a stored output can still be used."""
+        key = _digest(name, STAGE_VERSION, params,
+                      [self._stages[i].key for i in inputs])
+        self._stages[name] = _Stage(func, list(inputs), key, persist, valid)
+
+    def _path(self, name):
+        return os.path.join(self.state_dir, name + '.pkl')
+
+    def fresh(self, name):
+        stage = self._stages[name]
+        if self.force or self.keys.get(name) != stage.key:
+            return False
+        return not stage.persist or os.path.exists(self._path(name))
+
+    def output(self, name):
+        """Output of a stage, read back if it is fresh, stored and still
+        valid, computed (with its stale inputs) otherwise."""
+        if name in self._outputs:
+            return self._outputs[name]
+        stage = self._stages[name]
+        start = time.perf_counter()
+        stored = self.fresh(name) and stage.persist
+        if stored:
+            with open(self._path(name), 'rb') as f:
+                out = pickle.load(f)
+            stored = stage.valid is None or stage.valid(out)
+        if stored:
+            status = 'read'
+        else:
+            args = [self.output(i) for i in stage.inputs]
+            start = time.perf_counter()
+            with self.instrument.stage(name) as record:
+                out = stage.func(*args)
+                record.rows = _rows(args, out)
+            status = 'ran'
+            if stage.persist:
+                tmp = self._path(name) + '.tmp'
+                with open(tmp, 'wb') as f:
+                    pickle.dump(out, f, pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, self._path(name))
+            self._save_key(name)
+        self.timings.append(StageTiming(name, status,
+                                        time.perf_counter() - start))
+        self._outputs[name] = out
+        return out
+
+    def _save_key(self, name):
+        self.keys[name] = self._stages[name].key
+        write_manifest(self.state_dir, STAGE_VERSION, 'stages', self.keys)
+
+    def run(self, names):
+        """Outputs of the named stages ({name: output}), running only the
+        stale stages they depend on. The stages not needed are skipped."""
+        outputs = {name: self.output(name) for name in names}
+        for name in self._stages:
+            if name not in self._outputs:
+                self.timings.append(StageTiming(name, 'skipped', 0.))
+        return outputs
+
+    def timing_frame(self):
+        """Timings of the run, in stage order, with the metrics of the
+        stages that ran."""
+        order = list(self._stages)
+        timings = sorted(self.timings, key=lambda t: order.index(t.stage)
+                         if t.stage in order else len(order))
+        metrics = self.instrument.frame().drop(columns=['run', 'wall'])
+        return pd.DataFrame(timings, columns=StageTiming._fields).merge(
+            metrics.drop_duplicates('stage', keep='last'), on='stage',
+            how='left')
+
+
+def _rows(args, out):
+    """Rows processed by a stage: those of its input frame, or of its
+    output frame for the first stage."""
+    for frame in list(args) + [out]:
+        if isinstance(frame, pd.DataFrame):
+            return len(frame)
+    return None
+
+
+def check(df):
+    """Consistency rates of the derived frame, with the per-nationality
+    passenger weights (75 kg Brazilian, 90 kg foreign airlines)."""
+    report = check_consistency(df, avgw=passenger_weights(df),
+                               add_columns=False)
+    return {'rate': report.rate.rename_axis('metric').rename(
+        'match_rate').to_frame(),
+            'by_airline': report.by_airline, 'by_month': report.by_month}
+
+
+def aggregate(df, top=TOP):
+    """The report tables, from the cube of df."""
+    cube = Cube.from_frame(df)
+    topk = TopK(cube)
+    routes = topk.top('rota_nome', 'decolagens', top)
+    quarter = df['quarter'].astype(object).max()
+    return {
+        'monthly': cube.rollup(['data', 'empresa_nacionalidade'],
+                               ['decolagens', 'passageiros_pagos',
+                                'rpk', 'ask']).reset_index(),
+        'airports': topk.top('aeroporto_de_origem_nome', 'decolagens', top),
+        'routes': routes,
+        'rpk_routes': topk.top('rota_nome', 'rpk', top),
+        'route_series': topk.series(
+            'rota_nome', routes['rota_nome'][:FACETS],
+            'decolagens').reset_index(),
+        'airport_series': cube.rollup(
+            ['aeroporto_de_origem_nome', 'data'], 'decolagens',
+            where={'aeroporto_de_origem_nome': list(topk.top(
+                'aeroporto_de_origem_nome', 'decolagens', FACETS)
+                ['aeroporto_de_origem_nome'])}).reset_index(),
+        'load_factor': rollup_load_factor(
+            cube, ['data', 'empresa_nacionalidade']).reset_index(),
+        'yoy': compare(cube, 'aeroporto_de_origem_nome', 'decolagens',
+                       period='quarter', lag='yoy', periods=[quarter]
+                       ).sort_values('delta').reset_index()[:top],
+    }
+
+
+def charts(tables, out_dir, formats=FORMATS, workers=1):
+    """Render the report charts; returns {chart name: [paths]}."""
+    specs = [
+        chart('takeoffs_month', tables['monthly'], 'data', 'decolagens',
+              title='Takeoffs per month', hue='empresa_nacionalidade',
+              height=6, aspect=10 / 6),
+        chart('load_factor_month', tables['load_factor'], 'data',
+              'load_factor', title='Load factor per month',
+              hue='empresa_nacionalidade', height=6, aspect=10 / 6),
+        chart('top_airports', tables['airports'],
+              'aeroporto_de_origem_nome', 'decolagens',
+              title='Takeoffs per airport', color='b'),
+        chart('top_routes', tables['routes'], 'rota_nome', 'decolagens',
+              title='Takeoffs per route', color='b', height=6,
+              aspect=10 / 6),
+        chart('top_rpk_routes', tables['rpk_routes'], 'rota_nome', 'rpk',
+              title='RPK per route', color='b', height=6, aspect=10 / 6),
+    ]
+    specs += facet_charts('route', tables['route_series'], 'data',
+                          'decolagens', 'rota_nome',
+                          title='Takeoffs per month - {}', color='b')
+    specs += facet_charts('airport', tables['airport_series'], 'data',
+                          'decolagens', 'aeroporto_de_origem_nome',
+                          title='Takeoffs per month - {}', color='b')
+    chart_dir = os.path.join(out_dir, 'charts')
+    paths = render_all(specs, chart_dir, formats, workers=workers)
+    return {c.name: [os.path.relpath(p, out_dir) for p in ps]
+            for c, ps in zip(specs, paths)}
+
+
+def charts_exist(chart_paths, out_dir):
+    """Whether every chart file of charts() is still in out_dir."""
+    return all(os.path.exists(os.path.join(out_dir, p))
+               for ps in chart_paths.values() for p in ps)
+
+
+def source_files(data_dir):
+    """Names of the resumo_anual_<year>.csv files of data_dir."""
+    return sorted(f for f in os.listdir(data_dir) if SOURCE_PATTERN.match(f))
+
+
+def _cell(value):
+    if value is None or value is pd.NA:
+        return ''
+    if isinstance(value, (float, np.floating)):
+        return '' if np.isnan(value) else '{:,.4g}'.format(value)
+    return str(value)
+
+
+def markdown_table(frame):
+    if frame.index.name is not None or isinstance(frame.index,
+                                                  pd.MultiIndex):
+        frame = frame.reset_index()
+    rows = [[str(c) for c in frame.columns]]
+    rows += [[_cell(v) for v in row]
+             for row in frame.itertuples(index=False, name=None)]
+    lines = ['| ' + ' | '.join(r) + ' |' for r in rows]
+    lines.insert(1, '|' + '---|' * len(frame.columns))
+    return '\n'.join(lines)
+
+
+def _sections(checks, tables, chart_paths):
+    """(title, frame or list of chart paths) of the report, in order."""
+    return [
+        ('Consistency of the reported metrics', checks['rate']),
+        ('Busiest airports', tables['airports'][:10]),
+        ('Busiest routes', tables['routes'][:10]),
+        ('Top RPK routes', tables['rpk_routes'][:10]),
+        ('Biggest year-over-year drops in takeoffs', tables['yoy'][:10]),
+        ('Charts', [p for ps in chart_paths.values() for p in ps
+                    if p.endswith('.png') or p.endswith('.svg')]),
+    ]
+
+
+def write_report(out_dir, sources, timings, checks, tables, chart_paths):
+    """Write report.md and report.html to out_dir; returns their paths."""
+    sections = _sections(checks, tables, chart_paths)
+    # one image per chart, PNG if there is one
+    images = {}
+    for p in sections[-1][1]:
+        images.setdefault(os.path.splitext(p)[0], p)
+    sections[-1] = (sections[-1][0], sorted(images.values()))
+
+    md = ['# ANAC summary report', '',
+          'Sources: ' + ', '.join(sources), '',
+          '## Stages', '', markdown_table(timings)]
+    page = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8">',
+            '<title>ANAC summary report</title></head><body>',
+            '<h1>ANAC summary report</h1>',
+            '<p>Sources: {}</p>'.format(html.escape(', '.join(sources))),
+            '<h2>Stages</h2>', timings.to_html(index=False)]
+    for title, content in sections:
+        md += ['', '## ' + title, '']
+        page.append('<h2>{}</h2>'.format(html.escape(title)))
+        if isinstance(content, pd.DataFrame):
+            md.append(markdown_table(content))
+            page.append(content.to_html(float_format='{:,.4g}'.format))
+        else:
+            md += ['![{0}]({0})'.format(p) for p in content]
+            page += ['<img src="{}">'.format(html.escape(p))
+                     for p in content]
+    page.append('</body></html>')
+
+    paths = []
+    for name, lines in [('report.md', md), ('report.html', page)]:
+        path = os.path.join(out_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        paths.append(path)
+    return paths
+
+
+def build_report(data_dir, out_dir, files=None, formats=FORMATS, workers=1,
+                 force=False, instrument=None):
+    """Run the stale stages for the resumo_anual files of data_dir
+    (default: source_files(data_dir)) and write the report. Returns the
+    Pipeline."""
+    if files is None:
+        files = source_files(data_dir)
+    paths = [os.path.join(data_dir, f) for f in files]
+    os.makedirs(out_dir, exist_ok=True)
+    state_dir = os.path.join(out_dir, STATE_DIRNAME)
+    pipe = Pipeline(state_dir, force, instrument)
+    pipe.add('load', lambda: load_anac(data_dir, files, workers=workers),
+             params=source_key(paths, state_dir), persist=False)
+    pipe.add('derive', add_derived_columns, ['load'], persist=False)
+    pipe.add('check', check, ['derive'])
+    pipe.add('aggregate', aggregate, ['derive'], params=TOP)
+    pipe.add('chart', lambda tables: charts(tables, out_dir, formats,
+                                            workers),
+             ['aggregate'], params=list(formats),
+             valid=lambda paths: charts_exist(paths, out_dir))
+    out = pipe.run(['check', 'aggregate', 'chart'])
+
+    start = time.perf_counter()
+    with pipe.instrument.stage('report'):
+        write_report(out_dir, files, pipe.timing_frame(), out['check'],
+                     out['aggregate'], out['chart'])
+    pipe.timings.append(StageTiming('report', 'ran',
+                                    time.perf_counter() - start))
+    return pipe
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build the ANAC summary report.')
+    parser.add_argument('data_dir', help='folder with resumo_anual files')
+    parser.add_argument('out_dir', help='folder for the report and charts')
+    parser.add_argument('--files', nargs='+',
+                        help='resumo_anual files (default: the '
+                             'resumo_anual_<year>.csv files of data_dir)')
+    parser.add_argument('--formats', nargs='+', default=list(FORMATS),
+                        choices=['png', 'svg', 'pdf'])
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--force', action='store_true',
+                        help='run every stage again')
+    parser.add_argument('--metrics',
+                        help='JSON or CSV file for the stage metrics (CSV '
+                             'files get the records of every run)')
+    parser.add_argument('--profile', nargs='+', default=[],
+                        help='stages to run under the sampling profiler')
+    args = parser.parse_args(argv)
+    instrument = Instrument(args.profile, StackSampler(
+        os.path.join(args.out_dir, 'profiles')) if args.profile else None)
+    pipe = build_report(args.data_dir, args.out_dir, args.files,
+                        args.formats, args.workers, args.force, instrument)
+    print(pipe.timing_frame().to_string(index=False))
+    if args.metrics:
+        instrument.export(args.metrics, append=True)
+    print('report written to', os.path.join(args.out_dir, 'report.html'))
+
+
+if __name__ == '__main__':
+    main()
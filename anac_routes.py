@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Route index over the cube.
+
+The (month, origin, destination) cuboid is turned into integer arrays:
+airports and months get ids (sorted, like the categoricals of
+anac_derive), every airport pair with traffic gets a route id, and the
+edges (one per route and month) are kept sorted by route, so a route's
+time series is a slice. Per month (or over all months) the edges give a
+sparse origin x destination adjacency matrix weighted by takeoffs,
+passengers, RPK or ASK, from which hub metrics such as the centrality of
+GRU are computed.
+
+Airports are identified by their ICAO code (key='sigla'); their names are
+not unique, so they are only used as labels (names, and the name columns
+of routes()). Route labels are 'ORIGIN->DESTINATION' as in rota and
+rota_nome.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import eigsh
+
+WEIGHTS = ['decolagens', 'passageiros_pagos', 'rpk', 'ask']
+CENTRALITY = ['degree', 'strength', 'eigenvector']
+
+
+def _airport_names(cube, airports, key):
+    """Name of each airport (by key) as a Series, NaN where unknown."""
+    names = []
+    for end in ['origem', 'destino']:
+        cols = ['aeroporto_de_{}_{}'.format(end, c) for c in (key, 'nome')]
+        if key != 'nome' and all(c in cube.dimensions for c in cols):
+            cub = cube.cuboid(cols).dropna(subset=cols)
+            names.append(pd.Series(cub[cols[1]].astype(object).to_numpy(),
+                                   index=cub[cols[0]].astype(object)))
+    if not names:
+        return pd.Series(np.nan, index=airports, dtype=object, name='nome')
+    names = pd.concat(names)
+    names = names[~names.index.duplicated()]
+    return names.reindex(airports).rename('nome')
+
+
+class RouteIndex:
+    """Edges of the route graph, one per route and month."""
+
+    def __init__(self, cube, key='sigla', weights=WEIGHTS, sep='->'):
+        self.key = key
+        self.sep = sep
+        self.origin_col = 'aeroporto_de_origem_' + key
+        self.destination_col = 'aeroporto_de_destino_' + key
+        self.route_col = 'rota' if key == 'sigla' else 'rota_' + key
+        self.weights = [w for w in weights if w in cube.measures]
+        cub = cube.cuboid(['data', self.origin_col, self.destination_col])
+        cub = cub.dropna(subset=[self.origin_col, self.destination_col])
+
+        ends = pd.concat([cub[self.origin_col].astype(object),
+                          cub[self.destination_col].astype(object)])
+        self.airports = pd.Index(ends.unique()).sort_values()
+        self.months = pd.Index(cub['data'].astype(object).unique()
+                               ).sort_values()
+        self.names = _airport_names(cube, self.airports, key)
+        n = len(self.airports)
+        origin = self.airports.get_indexer(
+            cub[self.origin_col].astype(object))
+        destination = self.airports.get_indexer(
+            cub[self.destination_col].astype(object))
+        month = self.months.get_indexer(cub['data'].astype(object))
+
+        pair, route = np.unique(origin.astype(np.int64) * n + destination,
+                                return_inverse=True)
+        route = route.reshape(-1)
+        order = np.lexsort((month, route))
+        self.route_origin = (pair // n).astype(np.int32)
+        self.route_destination = (pair % n).astype(np.int32)
+        self.route = route[order].astype(np.int32)
+        self.month = month[order].astype(np.int32)
+        self.origin = origin[order].astype(np.int32)
+        self.destination = destination[order].astype(np.int32)
+        self.values = {
+            w: cub[w].to_numpy(dtype=np.float64, na_value=0)[order]
+            for w in self.weights}
+        # edges of route r: start[r]:start[r + 1]
+        self.start = np.searchsorted(self.route, np.arange(len(pair) + 1))
+        self._pairs = pd.Index(pair)
+        self._adjacency = {}
+
+    def __len__(self):
+        return len(self.route_origin)
+
+    def _month_mask(self, month):
+        if month is None:
+            return slice(None)
+        return self.month == self.months.get_loc(month)
+
+    def _airport_id(self, airport):
+        return self.airports.get_loc(airport)
+
+    def route_id(self, origin, destination):
+        """Route id of an airport pair (KeyError if it has no traffic)."""
+        pair = (self._airport_id(origin) * len(self.airports)
+                + self._airport_id(destination))
+        return self._pairs.get_loc(pair)
+
+    def routes(self, ids):
+        """Frame with the origin, destination and label of route ids, and
+        their names when airports are keyed by code."""
+        ids = np.asarray(ids, dtype=np.int64)
+        origin = self.airports[self.route_origin[ids]]
+        destination = self.airports[self.route_destination[ids]]
+        out = pd.DataFrame({
+            self.origin_col: origin, self.destination_col: destination,
+            self.route_col: [str(o) + self.sep + str(d)
+                             for o, d in zip(origin, destination)]})
+        if self.key != 'nome':
+            origin = self.names.to_numpy()[self.route_origin[ids]]
+            destination = self.names.to_numpy()[self.route_destination[ids]]
+            out['aeroporto_de_origem_nome'] = origin
+            out['aeroporto_de_destino_nome'] = destination
+            out['rota_nome'] = [str(o) + self.sep + str(d)
+                                for o, d in zip(origin, destination)]
+        return out
+
+    def adjacency(self, weight='decolagens', month=None):
+        """Sparse (airports x airports) matrix of weight from origin (row)
+        to destination (column), in month or over all the months."""
+        key = (weight, month)
+        if key not in self._adjacency:
+            mask = self._month_mask(month)
+            n = len(self.airports)
+            self._adjacency[key] = sparse.csr_matrix(
+                (self.values[weight][mask],
+                 (self.origin[mask], self.destination[mask])), shape=(n, n))
+        return self._adjacency[key]
+
+    def route_totals(self, weight='decolagens', month=None):
+        """weight of every route id, in month or over all the months."""
+        mask = self._month_mask(month)
+        return np.bincount(self.route[mask], self.values[weight][mask],
+                           minlength=len(self))
+
+    def top_routes(self, weight='decolagens', k=10, month=None):
+        """The k routes with the highest weight, highest first."""
+        totals = self.route_totals(weight, month)
+        k = min(k, len(totals))
+        top = np.argpartition(-totals, k - 1)[:k] if k else totals[:0]
+        top = top[np.argsort(-totals[top], kind='stable')]
+        out = self.routes(top)
+        out[weight] = totals[top]
+        return out
+
+    def routes_touching(self, airport, weight='decolagens', month=None):
+        """Routes from or to airport with their weight, highest first."""
+        a = self._airport_id(airport)
+        ids = np.flatnonzero((self.route_origin == a)
+                             | (self.route_destination == a))
+        totals = self.route_totals(weight, month)[ids]
+        order = np.argsort(-totals, kind='stable')
+        out = self.routes(ids[order])
+        out[weight] = totals[order]
+        return out
+
+    def route_series(self, origin, destination, weights=None):
+        """Monthly weights of a route over all the months (0 where it had
+        no traffic), indexed by data."""
+        weights = self.weights if weights is None else list(weights)
+        r = self.route_id(origin, destination)
+        edges = slice(self.start[r], self.start[r + 1])
+        out = pd.DataFrame(0., index=self.months.rename('data'),
+                           columns=weights)
+        for w in weights:
+            out.iloc[self.month[edges], out.columns.get_loc(w)] = \
+                self.values[w][edges]
+        return out
+
+    def centrality(self, weight='decolagens', month=None, kind='strength'):
+        """Centrality of every airport in the undirected route graph,
+        highest first. kind is 'degree' (share of the other airports it is
+        linked to), 'strength' (share of the total weight of the routes it
+        is on) or 'eigenvector' (unit-norm eigenvector centrality). The
+        airport names are in names."""
+        a = self.adjacency(weight, month)
+        s = (a + a.T).tocsr()
+        if kind == 'degree':
+            s.setdiag(0)
+            s.eliminate_zeros()
+            value = np.diff(s.indptr) / max(len(self.airports) - 1, 1)
+        elif kind == 'strength':
+            value = np.asarray(s.sum(axis=1)).ravel() / max(s.sum() / 2, 1)
+        elif kind == 'eigenvector':
+            _, vec = eigsh(s.astype(np.float64), k=1, which='LA')
+            value = np.abs(vec[:, 0])
+        else:
+            raise ValueError('unknown centrality: {}'.format(kind))
+        return pd.Series(value, index=self.airports.rename('aeroporto'),
+                         name=kind).sort_values(ascending=False)
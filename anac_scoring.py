@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Screening of the RTK values with the persisted residual model.
+
+The residual model of anac_fuzzyc.py predicts rtk_calc - rtk from the
+operational data_transform features: rtk and rtk_calc themselves (and
+their consistency flag) are left out, otherwise any linear model would
+reproduce the residual exactly. fit_residual_model fits and saves it,
+together with the CategoryEncoder of its encoded columns and the spread of
+its training errors. score_frame scores rows in vectorized batches: the rows
+whose residual is further than threshold spreads from the predicted one
+are flagged. score_file does the same over a resumo_anual file, chunk by
+chunk, keeping only the flagged rows, and warns when the model scores
+slower than MAX_US_ROW microseconds per row.
+
+    python anac_scoring.py model.joblib resumo_anual_2022.csv flagged.csv
+"""
+
+import argparse
+import os
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from anac_consistency import calc_metrics
+from anac_models import load_model, save_model
+from anac_stream import CHUNKSIZE, iter_chunks
+from anac_weights import passenger_weights
+
+TARGET = 'rtk_residual'
+THRESHOLD = 3
+BATCH_SIZE = 100000
+# scoring time per row (microseconds) for hundreds of thousands of rows/s
+MAX_US_ROW = 10
+
+# columns kept with the scores to identify the rows
+ID_COLUMNS = ['ano', 'mes', 'empresa_sigla', 'aeroporto_de_origem_sigla',
+              'aeroporto_de_destino_sigla', 'natureza', 'grupo_de_voo']
+SCORE_COLUMNS = ['residual', 'predicted', 'error', 'flagged']
+
+# the columns the residual is computed from, or computed from them
+TARGET_COLUMNS = ['rtk', 'rtk_calc', 'rtk_ok']
+
+
+def residual(df):
+    """rtk_calc - rtk, the target of the residual model."""
+    return (df['rtk_calc'].to_numpy(dtype=np.float64, na_value=np.nan)
+            - df['rtk'].to_numpy(dtype=np.float64, na_value=np.nan))
+
+
+def inputs(x):
+    """x without the TARGET_COLUMNS: the features of the residual model."""
+    return x.drop(columns=[c for c in TARGET_COLUMNS if c in x.columns])
+
+
+def fit_residual_model(model, x, encoder, path, **info):
+    """Fit model on the data_transform output x (its inputs() columns),
+    save it to path with the encoder that encoded x and return it."""
+    y = residual(x)
+    x = inputs(x)
+    values = x.to_numpy(dtype=np.float64)
+    model.fit(values, y)
+    errors = y - model.predict(values)
+    save_model(model, path, list(x.columns), TARGET, encoder=encoder,
+               scale=float(np.std(errors)), **info)
+    return model
+
+
+def _with_rtk_calc(df, bundle):
+    if 'rtk_calc' in df.columns:
+        return df
+    return df.assign(rtk_calc=calc_metrics(
+        df, passenger_weights(df, bundle.get('weights')),
+        ['rtk'])['rtk_calc'])
+
+
+def features(df, bundle):
+    """Float64 feature matrix of df for the model in bundle, NaN where a
+    value is missing or a category was not seen in training. Missing
+    categories get the code -1, as in training."""
+    names = bundle['features']
+    if 'rtk_calc' in names:
+        df = _with_rtk_calc(df, bundle)
+    encoder = bundle['encoder']
+    x = np.empty((len(df), len(names)), dtype=np.float64)
+    for j, name in enumerate(names):
+        if name in encoder.vocabularies:
+            x[:, j] = encoder.codes(df[name], name, unseen=np.nan)
+        else:
+            x[:, j] = df[name].to_numpy(dtype=np.float64, na_value=np.nan)
+    return x
+
+
+def score_frame(df, bundle, threshold=THRESHOLD, batch_size=BATCH_SIZE):
+    """Score the rows of df. Returns, for the rows with all the features
+    and a residual, their ID_COLUMNS with the observed and predicted
+    residuals, the error between them and whether it is beyond threshold
+    spreads."""
+    df = _with_rtk_calc(df, bundle)
+    x = features(df, bundle)
+    y = residual(df)
+    rows = np.flatnonzero(~np.isnan(x).any(axis=1) & ~np.isnan(y))
+    y = y[rows]
+    predicted = np.empty(len(rows), dtype=np.float64)
+    model = bundle['model']
+    for start in range(0, len(rows), batch_size):
+        predicted[start:start + batch_size] = model.predict(
+            x[rows[start:start + batch_size]])
+    error = y - predicted
+    out = df.iloc[rows][[c for c in ID_COLUMNS if c in df.columns]].copy()
+    out['residual'] = y
+    out['predicted'] = predicted
+    out['error'] = error
+    out['flagged'] = np.abs(error) > threshold * bundle['scale']
+    return out
+
+
+def score_file(path, bundle, threshold=THRESHOLD, chunksize=CHUNKSIZE,
+               out=None, max_us_row=MAX_US_ROW):
+    """Flagged rows of a resumo_anual file, scored chunksize rows at a
+    time. With out, they are also written there as CSV as they come.
+    Warns if the first chunk takes more than max_us_row microseconds per
+    row to score."""
+    flagged = []
+    header = True
+    timed = False
+    for chunk in iter_chunks(os.path.dirname(path),
+                             [os.path.basename(path)], chunksize):
+        start = time.perf_counter()
+        scores = score_frame(chunk, bundle, threshold)
+        if not timed and len(chunk):
+            timed = True
+            us_row = 1e6 * (time.perf_counter() - start) / len(chunk)
+            if max_us_row is not None and us_row > max_us_row:
+                warnings.warn('{} scores at {:.1f} us/row, over the {} '
+                              'us/row budget'.format(
+                                  bundle.get('name', 'the model'), us_row,
+                                  max_us_row))
+        scores = scores[scores['flagged'].to_numpy()]
+        if out is not None:
+            scores.to_csv(out, mode='w' if header else 'a', header=header)
+            header = False
+        flagged.append(scores)
+    return pd.concat(flagged) if flagged else pd.DataFrame(
+        columns=ID_COLUMNS + SCORE_COLUMNS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Flag the anomalous RTK values of a resumo_anual file.')
+    parser.add_argument('model', help='model saved by fit_residual_model')
+    parser.add_argument('source', help='resumo_anual CSV file')
+    parser.add_argument('out', help='CSV file for the flagged rows')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE)
+    parser.add_argument('--max-us-row', type=float, default=MAX_US_ROW,
+                        help='warn when scoring is slower than this')
+    args = parser.parse_args(argv)
+    flagged = score_file(args.source, load_model(args.model), args.threshold,
+                         args.chunksize, args.out, args.max_us_row)
+    print('{} flagged rows written to {}'.format(len(flagged), args.out))
+
+
+if __name__ == '__main__':
+    main()
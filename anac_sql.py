@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+SQL over the monthly store of anac_store, with DuckDB.
+
+connect() opens a DuckDB connection with two views over the store's
+Feather files:
+
+- rows: the processed rows of every stored month, with the snake_case
+  columns, the derived columns (data, quarter, rota, rota_nome,
+  load_factor), the <metric>_calc values and the <metric>_ok flags;
+- cube: the cube base cells of every month (sums of the measures and
+  linhas, the number of rows behind each cell).
+
+The views scan the files through a pyarrow dataset with one fragment per
+month: a query only reads the columns it uses, and a filter on ano/mes
+skips the other months' files altogether. The ROLLUPS are materialized as
+tables from the cube, with the summed measures and the load factor (with
+the rules of anac_loadfactor), the first time a query names them, and
+rebuilt when the store changes; queries that do not use them never scan
+the whole cube. With a database file they are kept between sessions.
+
+    python anac_sql.py store_dir "SELECT data, sum(decolagens) FROM rows
+        WHERE aeroporto_de_origem_sigla = 'SBGR' GROUP BY data ORDER BY 1"
+"""
+
+import argparse
+import hashlib
+import os
+import re
+
+import duckdb
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+from anac_loader import MANIFEST
+from anac_loadfactor import PAIRED
+from anac_store import stored_months
+
+# table name -> dimensions
+ROLLUPS = {
+    'airport_month': ['ano', 'mes', 'data', 'aeroporto_de_origem_sigla',
+                      'aeroporto_de_origem_nome'],
+    'route_month': ['ano', 'mes', 'data', 'rota', 'rota_nome',
+                    'empresa_nacionalidade'],
+    'airline_month': ['ano', 'mes', 'data', 'empresa_sigla', 'empresa_nome',
+                      'empresa_nacionalidade'],
+    'nationality_month': ['ano', 'mes', 'data', 'empresa_nacionalidade'],
+}
+
+# the load factor of the summed PAIRED columns of anac_loadfactor
+LOAD_FACTOR_SQL = ('CASE WHEN ask_lf = 0 THEN 0 '
+                   'WHEN rpk_lf > ask_lf THEN passageiros_pagos_lf / '
+                   'nullif(assentos_lf, 0) '
+                   'ELSE rpk_lf / ask_lf END')
+
+META_TABLE = 'anac_rollups'
+
+
+def store_digest(store_dir):
+    """Digest of the store manifest; it changes whenever a month does."""
+    with open(os.path.join(store_dir, MANIFEST), 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def month_dataset(store_dir, kind, months=None):
+    """pyarrow dataset over the store's <kind> files (rows or cube), one
+    fragment per month tagged with its ano and mes. The month files may
+    have narrowed their columns differently; they are read with the
+    widest type of each column."""
+    if months is None:
+        months = stored_months(store_dir)
+    if not months:
+        raise ValueError('no months stored in {}'.format(store_dir))
+    paths = [os.path.join(store_dir, kind, key + '.feather')
+             for key in months]
+    schema = pa.unify_schemas(
+        [ds.dataset(p, format='ipc').schema for p in paths],
+        promote_options='permissive').remove_metadata()
+    partitions = []
+    for key in months:
+        ano, mes = key.split('-')
+        partitions.append((ds.field('ano') == int(ano))
+                          & (ds.field('mes') == int(mes)))
+    return ds.FileSystemDataset.from_paths(
+        paths, schema=schema, format=ds.IpcFileFormat(),
+        filesystem=fs.LocalFileSystem(), partitions=partitions)
+
+
+def _measures(con):
+    dims = {d for by in ROLLUPS.values() for d in by}
+    columns = con.execute('DESCRIBE cube').df()
+    return [c for c, t in zip(columns['column_name'], columns['column_type'])
+            if c not in dims and t not in ('VARCHAR', 'BOOLEAN')
+            and not t.startswith('ENUM')]
+
+
+def materialize(con, name, by, where=None):
+    """Create (or replace) table name with the sums of the cube measures
+    and the load factor grouped by the dimensions in by. where is an
+    optional SQL condition on the cube."""
+    by = [by] if isinstance(by, str) else list(by)
+    sums = ['sum({0}) AS {0}'.format(m) for m in _measures(con)]
+    con.execute(
+        'CREATE OR REPLACE TABLE {name} AS '
+        'SELECT * EXCLUDE ({paired}), {lf} AS load_factor FROM ('
+        'SELECT {by}, {sums} FROM cube {where} GROUP BY {by}) '
+        'ORDER BY {by}'.format(
+            name=name, paired=', '.join(PAIRED), lf=LOAD_FACTOR_SQL,
+            by=', '.join(by), sums=', '.join(sums),
+            where='WHERE ' + where if where else ''))
+
+
+def refresh_rollups(con, store_dir, rollups=ROLLUPS, force=False):
+    """Materialize the rollups that are missing or older than the store.
+    Returns the names of the tables rebuilt."""
+    digest = store_digest(store_dir)
+    con.execute('CREATE TABLE IF NOT EXISTS {} '
+                '(name VARCHAR PRIMARY KEY, digest VARCHAR)'.format(
+                    META_TABLE))
+    built = dict(con.execute('SELECT name, digest FROM {}'.format(
+        META_TABLE)).fetchall())
+    rebuilt = []
+    for name, by in rollups.items():
+        if not force and built.get(name) == digest:
+            continue
+        materialize(con, name, by)
+        con.execute('INSERT OR REPLACE INTO {} VALUES (?, ?)'.format(
+            META_TABLE), [name, digest])
+        rebuilt.append(name)
+    return rebuilt
+
+
+def referenced_rollups(sql, rollups=ROLLUPS):
+    """The rollups (name: dimensions) whose table sql names."""
+    return {name: by for name, by in rollups.items()
+            if re.search(r'\b{}\b'.format(name), sql, re.IGNORECASE)}
+
+
+def connect(store_dir, database=':memory:', rollups=None, force=False):
+    """DuckDB connection with the rows and cube views over the store.
+    database is ':memory:' or a DuckDB file where the rollups are kept;
+    the rollups given (name: dimensions, e.g. ROLLUPS) are brought up to
+    date, all of them rebuilt with force."""
+    con = duckdb.connect(database)
+    for kind in ['rows', 'cube']:
+        con.register('{}_dataset'.format(kind),
+                     month_dataset(store_dir, kind))
+        con.execute('CREATE OR REPLACE TEMP VIEW {0} AS '
+                    'SELECT * FROM {0}_dataset'.format(kind))
+    if rollups:
+        refresh_rollups(con, store_dir, rollups, force)
+    return con
+
+
+def query(store_dir, sql, params=None, database=':memory:', refresh=False):
+    """Result of one SQL query over the store, as a DataFrame. Only the
+    rollups the query names are built (or checked); refresh rebuilds
+    them."""
+    con = connect(store_dir, database, referenced_rollups(sql), refresh)
+    try:
+        return con.execute(sql, params).df()
+    finally:
+        con.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run a SQL query over the ANAC monthly store.')
+    parser.add_argument('store', help='store folder (see anac_store)')
+    parser.add_argument('sql', help='query over rows, cube or the rollups')
+    parser.add_argument('--database', default=':memory:',
+                        help='DuckDB file that keeps the rollup tables')
+    parser.add_argument('--refresh', action='store_true',
+                        help='rebuild the rollups the query uses')
+    parser.add_argument('--out', help='CSV file for the result')
+    args = parser.parse_args(argv)
+    result = query(args.store, args.sql, database=args.database,
+                   refresh=args.refresh)
+    if args.out:
+        result.to_csv(args.out, index=False)
+    else:
+        print(result.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
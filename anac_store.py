@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Monthly partitioned store of the processed ANAC data.
+
+ANAC republishes the current year's resumo_anual file as it grows. ingest()
+splits a file (or frame) by (ano, mes), compares each month with what is
+already stored and only processes the new or changed months, or those
+processed with another weight table: derived columns, calculated metrics,
+consistency flags and the month's cube are written to one Feather file
+each under the store directory. Months missing from the new file are
+kept. Only the store itself needs pyarrow; process() does not.
+
+    store/manifest.json
+    store/rows/2021-04.feather     processed rows of April 2021
+    store/cube/2021-04.feather     cube base of April 2021
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from anac_consistency import METRICS, calc_metrics, match_masks
+from anac_cube import ATTRIBUTES, GRAIN, Cube
+from anac_derive import add_derived_columns, concat_frames
+from anac_loader import (CACHE_DIRNAME, read_manifest, read_resumo,
+                         restore_missing, write_manifest)
+from anac_weights import passenger_weights
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # process() still works; the store itself needs pyarrow
+    feather = None
+
+STORE_DIRNAME = 'store'
+STORE_VERSION = 4
+
+
+def default_store(folder):
+    return os.path.join(folder, CACHE_DIRNAME, STORE_DIRNAME)
+
+
+def month_key(ano, mes):
+    return '{}-{:02}'.format(int(ano), int(mes))
+
+
+def _read_manifest(store_dir):
+    return read_manifest(store_dir, STORE_VERSION, 'months')
+
+
+def _write_manifest(store_dir, months):
+    write_manifest(store_dir, STORE_VERSION, 'months', months)
+
+
+def _require_feather():
+    if feather is None:
+        raise ImportError('the monthly store needs pyarrow')
+
+
+def _write(df, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    feather.write_feather(df.reset_index(drop=True), tmp, compression='lz4')
+    os.replace(tmp, path)
+
+
+def month_digest(df):
+    """Order-independent digest of the rows of a month."""
+    rows = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.sha1(np.sort(rows).tobytes()).hexdigest()
+
+
+def weights_digest(weights):
+    """Digest of a weight table (None without one)."""
+    if weights is None:
+        return None
+    return month_digest(weights.reindex(columns=sorted(weights.columns)))
+
+
+def process(df, weights=None):
+    """Add the derived columns, the calculated metrics and one <metric>_ok
+    consistency flag per metric to a frame of raw (renamed) rows."""
+    df = add_derived_columns(df)
+    calc = calc_metrics(df, avgw=passenger_weights(df, weights))
+    ok = match_masks(df, calc)
+    for col in calc.columns:
+        df[col] = calc[col]
+    for col in ok.columns:
+        df[col + '_ok'] = ok[col]
+    return df
+
+
+def ingest(source, store_dir, weights=None, force=False):
+    """Bring the store up to date with source (a resumo_anual path or a
+    frame with the renamed columns). Returns a frame with the status of
+    each month of source: 'new', 'changed' or 'unchanged'. A month is
+    also processed again when the weight table differs from the one it
+    was processed with."""
+    _require_feather()
+    raw = read_resumo(source) if isinstance(source, str) else source
+    weights_key = weights_digest(weights)
+    os.makedirs(store_dir, exist_ok=True)
+    months = _read_manifest(store_dir)
+    status = []
+    for (ano, mes), rows in raw.groupby(['ano', 'mes'], sort=True):
+        key = month_key(ano, mes)
+        digest = month_digest(rows)
+        entry = months.get(key)
+        if (entry and entry['digest'] == digest
+                and entry.get('weights') == weights_key and not force):
+            status.append((ano, mes, key, 'unchanged', len(rows)))
+            continue
+        processed = process(rows.reset_index(drop=True), weights)
+        _write(processed, os.path.join(store_dir, 'rows', key + '.feather'))
+        _write(Cube.from_frame(processed).base,
+               os.path.join(store_dir, 'cube', key + '.feather'))
+        months[key] = {'digest': digest, 'weights': weights_key,
+                       'rows': len(rows)}
+        status.append((ano, mes, key, 'changed' if entry else 'new',
+                       len(rows)))
+        _write_manifest(store_dir, months)
+    return pd.DataFrame(status, columns=['ano', 'mes', 'month', 'status',
+                                         'rows'])
+
+
+def stored_months(store_dir):
+    return sorted(_read_manifest(store_dir))
+
+
+def _read_months(store_dir, kind, months=None, columns=None):
+    _require_feather()
+    if months is None:
+        months = stored_months(store_dir)
+    frames = [feather.read_feather(
+        os.path.join(store_dir, kind, key + '.feather'), columns=columns,
+        memory_map=True) for key in months]
+    for f in frames:
+        restore_missing(f)
+    return concat_frames(frames)
+
+
+def load_rows(store_dir, months=None, columns=None):
+    """Processed rows of the given months ('YYYY-MM'; default: all)."""
+    return _read_months(store_dir, 'rows', months, columns)
+
+
+def load_cube(store_dir, months=None):
+    """Cube over the given months, built from the stored month cubes."""
+    base = _read_months(store_dir, 'cube', months)
+    dims = [c for c in GRAIN + ATTRIBUTES if c in base.columns]
+    cube = Cube(base, dims, [c for c in base.columns if c not in dims])
+    cube.coarsen()
+    return cube
+
+
+def consistency_flags(store_dir, months=None):
+    """Stored <metric>_ok flags, with the month and airline of each row."""
+    return load_rows(store_dir, months,
+                     ['data', 'empresa_sigla'] + [m + '_ok'
+                                                  for m in METRICS])
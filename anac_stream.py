@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming (chunked) processing of the resumo_anual files.
+
+For histories that do not fit in memory the files are read in chunks of a
+fixed number of rows. Each chunk goes through the rename, the derived
+columns, the consistency check and the cube aggregation, and only its
+partial results are kept: its cube cells are folded into a running cube
+and its match counts into the running counts of the consistency check.
+The result is the same ConsistencyReport the in-memory path gives, and a
+cube at STREAM_GRAIN. The mismatching rows are only listed with
+mismatches=True, identified by their position over all the files (the
+index load_anac gives); the list grows with the data, not the chunk size.
+
+The files are unique at the full cube grain, so a cube at that grain is
+as large as the data. The running cube is kept at the month x airline x
+route grain instead (without nature and flight group); peak memory is one
+chunk plus that cube, which grows with the number of routes flown each
+month, not with the number of rows.
+"""
+
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from anac_consistency import (ConsistencyReport, METRICS, combine_counts,
+                              match_counts, report_from_counts)
+from anac_cube import ATTRIBUTES, COARSE_DROP, GRAIN, MEASURES, Cube
+from anac_loader import (DEFAULT_FILES, DEFAULT_FOLDER, apply_schema,
+                         read_options, snake_case)
+from anac_store import process
+
+CHUNKSIZE = 500000
+
+# grain of the running cube: month, airline, origin and destination
+STREAM_GRAIN = [c for c in GRAIN if c not in COARSE_DROP]
+
+# cube: Cube over all the rows
+# report: ConsistencyReport over all the rows
+# rows: number of rows read
+# missing: number of NaN values per column
+StreamResult = namedtuple('StreamResult',
+                          ['cube', 'report', 'rows', 'missing'])
+
+
+def iter_chunks(folder=DEFAULT_FOLDER, files=DEFAULT_FILES,
+                chunksize=CHUNKSIZE):
+    """Yield the renamed rows of the files, chunksize rows at a time,
+    indexed by their position over all the files."""
+    offset = 0
+    for name in files:
+        path = os.path.join(folder, name)
+        reader = pd.read_csv(path, chunksize=chunksize, **read_options(path))
+        with reader:
+            for chunk in reader:
+                chunk.columns = [snake_case(z) for z in chunk.columns]
+                apply_schema(chunk)
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                offset += len(chunk)
+                yield chunk
+
+
+def run_stream(folder=DEFAULT_FOLDER, files=DEFAULT_FILES,
+               chunksize=CHUNKSIZE, weights=None, grain=STREAM_GRAIN,
+               attributes=ATTRIBUTES, measures=MEASURES, mismatches=False):
+    """Process the files chunk by chunk and return a StreamResult. weights
+    is the weight table used for the RTK recalculation; grain the grain
+    of the cube (GRAIN keeps every row as a cell). With mismatches the
+    report lists the mismatching rows."""
+    cube = None
+    counts = None
+    missing = None
+    rows = 0
+    ok_cols = [m + '_ok' for m in METRICS]
+    for chunk in iter_chunks(folder, files, chunksize):
+        na = chunk.isna().sum()
+        missing = na if missing is None else missing.add(na, fill_value=0)
+        rows += len(chunk)
+        chunk = process(chunk, weights)
+        ok = chunk[ok_cols].set_axis(METRICS, axis=1)
+        part = match_counts(chunk, ok, mismatches)
+        counts = part if counts is None else combine_counts([counts, part])
+        part = Cube.from_frame(chunk, grain, attributes, measures)
+        del chunk, ok
+        cube = part if cube is None else Cube.concat([cube, part])
+        del part
+    if cube is None:
+        empty = pd.Series(np.nan, index=METRICS)
+        return StreamResult(None, ConsistencyReport(empty, None, None, {}),
+                            0, pd.Series(dtype=np.int64))
+    return StreamResult(cube, report_from_counts(counts), rows,
+                        missing.astype(np.int64))
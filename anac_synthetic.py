@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic resumo_anual data for benchmarks.
+
+generate() builds a frame with the exact columns of the ANAC files (raw
+names, in order) and realistic cardinalities: the 67 airlines (12
+Brazilian) of resumo_anual_2021.csv, by default the 1000 airports of a
+multi-decade history (60% Brazilian, with UF and region; the foreign
+ones only with country and continent), a pool of routes with
+Zipf-distributed traffic that grows with the scale, and the nature and
+flight group mixes of the real data. Like the real files, the rows are
+unique at the cube grain (month, airline, origin, destination, nature and
+flight group): each month's rows are distinct (airline, route, group)
+cells. The metrics follow the formulas of anac_consistency, are rounded
+to 6 significant figures like ANAC's, and a share of them is perturbed so
+the consistency rates are realistic. Some rows have no takeoffs, some
+have no operational data (NaN ASK/RPK/ATK/RTK, takeoffs, seats...), and
+some no baggage.
+
+Sizes are given as a scale of a year (YEAR_ROWS rows); scales above 1
+span as many years, ending at year, since a month only has room for so
+many cells. The route pool starts at the 1732 routes of 2021 and grows
+with the square root of the scale (17320 routes for 100 years): a longer
+history opens new routes while most old ones keep flying. The same seed
+always gives the same data. write_resumo() writes a frame as a
+resumo_anual CSV file (';', ISO-8859-1, decimal comma).
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+GENERATOR_VERSION = 3
+
+# rows of a year of resumo_anual (about the rate of resumo_anual_2021.csv)
+YEAR_ROWS = 28000
+# airlines of resumo_anual_2021.csv
+AIRLINES = 67
+BRAZILIAN_AIRLINES = 12
+# airports of a multi-decade history, the Brazilian share as in 2021
+AIRPORTS = 1000
+BRAZILIAN_SHARE = 0.6
+# routes of resumo_anual_2021.csv, the pool of a scale of 1
+ROUTES = 1732
+
+# share of the rows with no takeoffs, with no operational data, with no
+# baggage, and whose reported metrics do not match the calculated ones
+ZERO_TAKEOFFS = 0.007
+NO_OPERATIONS = 0.11
+NO_BAGGAGE = 0.009
+MISMATCH = 0.15
+
+RAW_COLUMNS = [
+    'EMPRESA (SIGLA)', 'EMPRESA (NOME)', 'EMPRESA (NACIONALIDADE)', 'ANO',
+    'MÊS', 'AEROPORTO DE ORIGEM (SIGLA)', 'AEROPORTO DE ORIGEM (NOME)',
+    'AEROPORTO DE ORIGEM (UF)', 'AEROPORTO DE ORIGEM (REGIÃO)',
+    'AEROPORTO DE ORIGEM (PAÍS)', 'AEROPORTO DE ORIGEM (CONTINENTE)',
+    'AEROPORTO DE DESTINO (SIGLA)', 'AEROPORTO DE DESTINO (NOME)',
+    'AEROPORTO DE DESTINO (UF)', 'AEROPORTO DE DESTINO (REGIÃO)',
+    'AEROPORTO DE DESTINO (PAÍS)', 'AEROPORTO DE DESTINO (CONTINENTE)',
+    'NATUREZA', 'GRUPO DE VOO', 'PASSAGEIROS PAGOS', 'PASSAGEIROS GRÁTIS',
+    'CARGA PAGA (KG)', 'CARGA GRÁTIS (KG)', 'CORREIO (KG)', 'ASK', 'RPK',
+    'ATK', 'RTK', 'COMBUSTÍVEL (LITROS)', 'DISTÂNCIA VOADA (KM)',
+    'DECOLAGENS', 'CARGA PAGA KM', 'CARGA GRATIS KM', 'CORREIO KM',
+    'ASSENTOS', 'PAYLOAD', 'HORAS VOADAS', 'BAGAGEM (KG)']
+
+REGIONS = {
+    'NORTE': ['AC', 'AM', 'AP', 'PA', 'RO', 'RR', 'TO'],
+    'NORDESTE': ['AL', 'BA', 'CE', 'MA', 'PB', 'PE', 'PI', 'RN', 'SE'],
+    'CENTRO-OESTE': ['DF', 'GO', 'MS', 'MT'],
+    'SUDESTE': ['ES', 'MG', 'RJ', 'SP'],
+    'SUL': ['PR', 'RS', 'SC']}
+
+COUNTRIES = [
+    ('ESTADOS UNIDOS DA AMÉRICA', 'AMÉRICA DO NORTE'),
+    ('CHILE', 'AMÉRICA DO SUL'), ('COLÔMBIA', 'AMÉRICA DO SUL'),
+    ('ARGENTINA', 'AMÉRICA DO SUL'), ('EQUADOR', 'AMÉRICA DO SUL'),
+    ('HOLANDA', 'EUROPA'), ('ALEMANHA', 'EUROPA'), ('PORTUGAL', 'EUROPA'),
+    ('PERU', 'AMÉRICA DO SUL'), ('LUXEMBURGO', 'EUROPA'),
+    ('PARAGUAI', 'AMÉRICA DO SUL'), ('ESPANHA', 'EUROPA'),
+    ('FRANÇA', 'EUROPA'), ('MÉXICO', 'AMÉRICA DO NORTE'),
+    ('PANAMÁ', 'AMÉRICA CENTRAL'), ('ETIÓPIA', 'ÁFRICA'),
+    ('ANGOLA', 'ÁFRICA'), ('CATAR', 'ÁSIA'),
+    ('EMIRADOS ÁRABES UNIDOS', 'ÁSIA'), ('AUSTRÁLIA', 'OCEANIA')]
+
+NAME_WORDS = ['SÃO', 'JOSÉ', 'BELÉM', 'SANTA', 'PORTO', 'RIO', 'CAMPO',
+              'NOVA', 'VITÓRIA', 'GOIÂNIA', 'MACAÉ', 'FOZ', 'CRUZ',
+              'ALEGRE', 'GRANDE', 'PRETO', 'VERDE', 'CABO', 'PAÇO', 'LUÍS']
+
+# nature/flight group mix of the real data
+GROUPS = ['REGULAR', 'NÃO REGULAR', 'IMPRODUTIVO']
+DOMESTIC_GROUPS = [0.67, 0.21, 0.12]
+INTERNATIONAL_GROUPS = [0.70, 0.28, 0.02]
+
+
+def _codes(n, prefixes, rng, length=4):
+    """n distinct codes of length letters starting with one of prefixes."""
+    letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    codes = set()
+    while len(codes) < n:
+        p = prefixes[rng.integers(len(prefixes))]
+        codes.add(p + ''.join(rng.choice(letters, length - len(p))))
+    return sorted(codes)
+
+
+def _names(n, rng):
+    words = np.array(NAME_WORDS)
+    return ['{} {} {}'.format(*rng.choice(words, 2), i) for i in range(n)]
+
+
+def _zipf_weights(n, a, rng):
+    w = 1. / np.arange(1, n + 1) ** a
+    return rng.permutation(w / w.sum())
+
+
+def route_count(scale):
+    """Size of the route pool of a scale."""
+    return int(round(ROUTES * max(1, scale) ** 0.5))
+
+
+def airports(n=AIRPORTS, n_br=None, rng=None):
+    """Frame of n airports (the first n_br Brazilian, by default the
+    BRAZILIAN_SHARE) and their popularity."""
+    rng = np.random.default_rng(rng)
+    if n_br is None:
+        n_br = int(round(BRAZILIAN_SHARE * n))
+    ufs = [(uf, region) for region, l in REGIONS.items() for uf in l]
+    uf = rng.integers(len(ufs), size=n_br)
+    country = rng.integers(len(COUNTRIES), size=n - n_br)
+    return pd.DataFrame({
+        'sigla': _codes(n_br, ['SB', 'SD', 'SN', 'SS', 'SW'], rng)
+        + _codes(n - n_br, ['K', 'SC', 'SK', 'SA', 'L', 'E', 'M'], rng),
+        'nome': _names(n, rng),
+        'uf': [ufs[i][0] for i in uf] + [np.nan] * (n - n_br),
+        'regiao': [ufs[i][1] for i in uf] + [np.nan] * (n - n_br),
+        'pais': ['BRASIL'] * n_br + [COUNTRIES[i][0] for i in country],
+        'continente': ['AMÉRICA DO SUL'] * n_br
+        + [COUNTRIES[i][1] for i in country],
+        'brasil': np.arange(n) < n_br,
+        'weight': np.concatenate([_zipf_weights(n_br, 1.2, rng) * 0.8,
+                                  _zipf_weights(n - n_br, 1.2, rng) * 0.2]),
+    })
+
+
+def airlines(n=AIRLINES, n_br=BRAZILIAN_AIRLINES, rng=None):
+    """Frame of n airlines (the first n_br Brazilian) and their share of
+    the rows."""
+    rng = np.random.default_rng(rng)
+    return pd.DataFrame({
+        'sigla': _codes(n, [''], rng, length=3),
+        'nome': ['LINHAS AÉREAS {} S/A'.format(i) for i in range(n)],
+        'nacionalidade': ['BRASILEIRA'] * n_br + ['ESTRANGEIRA'] * (n - n_br),
+        'brasil': np.arange(n) < n_br,
+        'weight': np.concatenate([_zipf_weights(n_br, 1.5, rng) * 0.78,
+                                  _zipf_weights(n - n_br, 1.1, rng) * 0.22]),
+    })
+
+
+def routes(ports, n=ROUTES, rng=None):
+    """Frame of n distinct airport pairs with at least one Brazilian end,
+    their distance (km) and traffic share."""
+    rng = np.random.default_rng(rng)
+    br = np.flatnonzero(ports['brasil'])
+    p_br = ports['weight'].to_numpy()[br]
+    p_all = ports['weight'].to_numpy()
+    m_all = len(ports)
+    if n > len(br) * (2 * m_all - len(br) - 1):
+        raise ValueError('{} airports have no room for {} routes'.format(
+            m_all, n))
+    pairs = np.empty(0, dtype=np.int64)
+    stalled = 0
+    while len(pairs) < n:
+        m = 2 * (n - len(pairs)) + 16
+        a = br[rng.choice(len(br), size=m, p=p_br / p_br.sum())]
+        b = rng.choice(m_all, size=m, p=p_all)
+        flip = rng.random(m) < 0.5
+        a, b = np.where(flip, b, a), np.where(flip, a, b)
+        drawn = np.concatenate([pairs, (a * m_all + b)[a != b]])
+        _, first = np.unique(drawn, return_index=True)
+        stalled = stalled + 1 if len(first) == len(pairs) else 0
+        if stalled > 100:
+            raise ValueError('no room for {} distinct routes'.format(n))
+        pairs = drawn[np.sort(first)]
+    pairs = np.sort(pairs[:n])
+    pairs = np.stack([pairs // m_all, pairs % m_all], axis=1)
+    domestic = (ports['brasil'].to_numpy()[pairs[:, 0]]
+                & ports['brasil'].to_numpy()[pairs[:, 1]])
+    distance = np.where(domestic, rng.lognormal(np.log(800), 0.6, n),
+                        rng.lognormal(np.log(5000), 0.6, n))
+    return pd.DataFrame({
+        'origin': pairs[:, 0], 'destination': pairs[:, 1],
+        'domestic': domestic,
+        'distance': np.clip(distance, 50, 15000).round(),
+        'weight': _zipf_weights(n, 1.0, rng)})
+
+
+def _round_sig(x, digits=6):
+    """Round to digits significant figures (and to an integer), like the
+    ANAC metrics."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mag = np.where(x > 0, np.floor(np.log10(np.abs(x))), 0)
+    factor = 10. ** (digits - 1 - mag)
+    return np.round(np.round(x * factor) / factor)
+
+
+def _cells(k, links, carriers, rng):
+    """k distinct (route, airline, group) cells of a month, drawn with the
+    traffic shares; domestic routes are flown by Brazilian airlines."""
+    link_w = links['weight'].to_numpy()
+    link_domestic = links['domestic'].to_numpy()
+    br = carriers['brasil'].to_numpy()
+    w = carriers['weight'].to_numpy()
+    n_air = len(carriers)
+    cells = np.empty(0, dtype=np.int64)
+    stalled = 0
+    while len(cells) < k:
+        m = 2 * (k - len(cells)) + 16
+        route = rng.choice(len(links), size=m, p=link_w)
+        domestic = link_domestic[route]
+        national = np.flatnonzero(br)[
+            rng.choice(br.sum(), size=m, p=w[br] / w[br].sum())]
+        airline = np.where(domestic, national,
+                           rng.choice(n_air, size=m, p=w))
+        group = np.where(
+            domestic, rng.choice(3, size=m, p=DOMESTIC_GROUPS),
+            rng.choice(3, size=m, p=INTERNATIONAL_GROUPS))
+        drawn = np.concatenate([cells, (route * n_air + airline) * 3 + group])
+        _, first = np.unique(drawn, return_index=True)
+        stalled = stalled + 1 if len(first) == len(cells) else 0
+        if stalled > 100:
+            raise ValueError('no room for {} distinct cells in a month'
+                             .format(k))
+        cells = drawn[np.sort(first)]
+    cells = cells[:k]
+    return cells // (3 * n_air), cells // 3 % n_air, cells % 3
+
+
+def generate(scale=1, year=2021, seed=0, n_airports=AIRPORTS,
+             n_routes=None):
+    """Synthetic resumo_anual frame of scale * YEAR_ROWS rows, with the raw
+    ANAC column names, over the ceil(scale) years ending at year, between
+    n_airports airports on n_routes routes (default: route_count(scale))."""
+    rng = np.random.default_rng(seed)
+    if n_routes is None:
+        n_routes = route_count(scale)
+    ports = airports(n_airports, rng=rng)
+    carriers = airlines(rng=rng)
+    links = routes(ports, n_routes, rng=rng)
+    n = int(round(scale * YEAR_ROWS))
+
+    # rows spread evenly over the months, distinct cells within each
+    months = 12 * max(1, int(np.ceil(scale)))
+    per_month = np.full(months, n // months)
+    per_month[:n % months] += 1
+    drawn = [_cells(k, links, carriers, rng) for k in per_month]
+    route, airline, group = (np.concatenate(x) for x in zip(*drawn))
+    index = np.repeat(np.arange(months), per_month)
+    years = year - months // 12 + 1 + index // 12
+    month = index % 12 + 1
+    domestic = links['domestic'].to_numpy()[route]
+
+    # operations of the month
+    takeoffs = np.maximum(1, rng.lognormal(np.log(10), 1.1, n).round())
+    takeoffs[rng.random(n) < ZERO_TAKEOFFS] = 0
+    leg = links['distance'].to_numpy()[route]
+    distance = leg * takeoffs
+    per_flight = np.where(domestic, rng.choice([70, 120, 174, 186], n),
+                          rng.choice([186, 220, 268, 300, 340], n))
+    seats = per_flight * takeoffs
+    productive = group != 2
+    pax = np.where(productive, np.round(seats * rng.beta(8, 2.5, n)), 0)
+    free_pax = np.round(pax * rng.beta(1, 40, n))
+    cargo = np.where(productive & (rng.random(n) < 0.6),
+                     np.round(rng.lognormal(7, 2, n)), 0)
+    free_cargo = np.where(rng.random(n) < 0.1,
+                          np.round(rng.lognormal(4, 1.5, n)), 0)
+    mail = np.where(productive & (rng.random(n) < 0.3),
+                    np.round(rng.lognormal(6, 2, n)), 0)
+    baggage = np.round(pax * rng.uniform(5, 15, n))
+    payload = per_flight * 100 * takeoffs
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dist = np.where(takeoffs > 0, distance / takeoffs, 0)
+    ask = seats * dist
+    rpk = pax * dist
+    rtk = (75 * pax + cargo + mail + baggage) * dist / 1000
+    atk = payload * dist / 1000
+    hours = np.round(takeoffs * leg / 750 + takeoffs * 0.4, 2)
+    fuel = np.round(distance * per_flight * 0.035)
+
+    # reported metrics that do not match the calculation
+    off = rng.random(n) < MISMATCH
+    rpk = np.where(off, rpk * rng.uniform(0.7, 1.3, n), rpk)
+    rtk = np.where(rng.random(n) < 2 * MISMATCH,
+                   rtk * rng.uniform(0.8, 1.2, n), rtk)
+
+    frame = pd.DataFrame({
+        'PASSAGEIROS PAGOS': pax, 'PASSAGEIROS GRÁTIS': free_pax,
+        'CARGA PAGA (KG)': cargo, 'CARGA GRÁTIS (KG)': free_cargo,
+        'CORREIO (KG)': mail, 'ASK': _round_sig(ask), 'RPK': _round_sig(rpk),
+        'ATK': _round_sig(atk), 'RTK': _round_sig(rtk),
+        'COMBUSTÍVEL (LITROS)': fuel, 'DISTÂNCIA VOADA (KM)': distance,
+        'DECOLAGENS': takeoffs,
+        'CARGA PAGA KM': _round_sig(cargo * dist),
+        'CARGA GRATIS KM': _round_sig(free_cargo * dist),
+        'CORREIO KM': _round_sig(mail * dist), 'ASSENTOS': seats,
+        'PAYLOAD': payload, 'HORAS VOADAS': hours, 'BAGAGEM (KG)': baggage})
+    # rows without operational data, and without baggage
+    no_ops = rng.random(n) < NO_OPERATIONS
+    frame.loc[no_ops, 'ASK':'HORAS VOADAS'] = np.nan
+    frame.loc[rng.random(n) < NO_BAGGAGE, 'BAGAGEM (KG)'] = np.nan
+
+    origin = ports.iloc[links['origin'].to_numpy()[route]]
+    destination = ports.iloc[links['destination'].to_numpy()[route]]
+    carrier = carriers.iloc[airline]
+    text = {
+        'EMPRESA (SIGLA)': carrier['sigla'],
+        'EMPRESA (NOME)': carrier['nome'],
+        'EMPRESA (NACIONALIDADE)': carrier['nacionalidade'],
+        'ANO': years, 'MÊS': month}
+    for prefix, ends in [('AEROPORTO DE ORIGEM', origin),
+                         ('AEROPORTO DE DESTINO', destination)]:
+        for col, name in [('sigla', 'SIGLA'), ('nome', 'NOME'), ('uf', 'UF'),
+                          ('regiao', 'REGIÃO'), ('pais', 'PAÍS'),
+                          ('continente', 'CONTINENTE')]:
+            text['{} ({})'.format(prefix, name)] = ends[col]
+    text['NATUREZA'] = np.where(domestic, 'DOMÉSTICA', 'INTERNACIONAL')
+    text['GRUPO DE VOO'] = np.array(GROUPS)[group]
+    text = pd.DataFrame({k: np.asarray(v) for k, v in text.items()})
+    df = pd.concat([text, frame], axis=1)[RAW_COLUMNS]
+    return df.sort_values(['ANO', 'MÊS', 'EMPRESA (SIGLA)'],
+                          kind='stable').reset_index(drop=True)
+
+
+def write_resumo(df, path):
+    """Write a raw frame as a resumo_anual CSV file."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    out = df.copy()
+    for col in out.columns:
+        if col != 'HORAS VOADAS' and pd.api.types.is_float_dtype(out[col]):
+            out[col] = out[col].astype('Int64')
+    tmp = path + '.tmp'
+    out.to_csv(tmp, sep=';', decimal=',', encoding='ISO-8859-1', index=False)
+    os.replace(tmp, path)
+    return path
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Top-K queries over the cube.
+
+select_top picks the k largest (or smallest) values with a partial
+selection (np.argpartition) and only sorts those k, instead of sorting the
+whole aggregate. TopK answers the top-K keys of a rollup by an additive
+measure, by the load factor (sum of RPK / sum of ASK, with the rules
+of anac_loadfactor) or by the change of a measure between two periods,
+and fetches the time series of the selected keys through the sorted
+index of a cached rollup instead of filtering the whole frame with isin.
+
+MonthlyTopK keeps a bounded heap per month, updated as complete months
+come in (e.g. from anac_store.ingest), so the per-month leaders never have
+to be recomputed.
+"""
+
+import heapq
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from anac_cube import as_list
+from anac_loadfactor import rollup_load_factor
+
+
+def select_top(values, k, ascending=False):
+    """The k largest (smallest with ascending) entries of a Series, in
+    order. NaN values come last."""
+    v = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    v = np.where(np.isnan(v), np.inf, v if ascending else -v)
+    k = min(k, len(v))
+    if k == 0:
+        return values.iloc[:0]
+    top = np.argpartition(v, k - 1)[:k]
+    return values.iloc[top[np.argsort(v[top], kind='stable')]]
+
+
+class TopK:
+    """Top-K queries and series fetches over a Cube."""
+
+    def __init__(self, cube):
+        self.cube = cube
+        self._series = {}
+
+    def values(self, by, measure, where=None):
+        """measure (additive or 'load_factor') per key of by."""
+        if measure == 'load_factor':
+            return rollup_load_factor(self.cube, by, where)[measure]
+        return self.cube.rollup(by, measure, where=where)[measure]
+
+    def top(self, by, measure, k=10, where=None, ascending=False):
+        """Frame with the k keys of by with the highest (lowest with
+        ascending) measure, highest first."""
+        return select_top(self.values(by, measure, where), k,
+                          ascending).reset_index()
+
+    def top_change(self, by, measure, before, after, k=10, period='data',
+                   where=None, ascending=False):
+        """Frame with the k keys of by whose measure grew the most (fell
+        the most with ascending) from period value before to after, with
+        both values and the change."""
+        where = dict(where or {}, **{period: [before, after]})
+        values = self.values(as_list(by) + [period], measure, where)
+        table = values.unstack(period)
+        if isinstance(table.columns, pd.CategoricalIndex):
+            table.columns = table.columns.astype(object)
+        table = table.reindex(columns=[before, after]).astype(
+            np.float64).fillna(0)
+        change = (table[after] - table[before]).rename('change')
+        top = select_top(change, k, ascending)
+        return pd.concat([table.loc[top.index], top], axis=1).reset_index()
+
+    def _rollup(self, by, period):
+        key = (tuple(by), period)
+        if key not in self._series:
+            self._series[key] = self.cube.rollup(by + [period])
+        return self._series[key]
+
+    def series(self, by, keys, measures, period='data'):
+        """measures per period for the given values of the first column of
+        by, read from the sorted index of the (by, period) rollup."""
+        frame = self._rollup(as_list(by), period)
+        keys = list(pd.unique(np.asarray(keys, dtype=object)))
+        return frame.loc[keys, as_list(measures)]
+
+
+class MonthlyTopK:
+    """The k largest values per month, kept in a bounded heap per month.
+    Each (month, key) must be pushed once, with its total for the month."""
+
+    def __init__(self, k=10):
+        self.k = k
+        self._heaps = {}
+        self._count = itertools.count()
+
+    def push(self, month, key, value):
+        if value != value:  # NaN
+            return
+        heap = self._heaps.setdefault(month, [])
+        item = (value, next(self._count), key)
+        if len(heap) < self.k:
+            heapq.heappush(heap, item)
+        elif value > heap[0][0]:
+            heapq.heapreplace(heap, item)
+
+    def update(self, month, values):
+        """Push the keys of a Series of month totals (only its top k can
+        enter the heap)."""
+        top = select_top(values.astype(np.float64), self.k)
+        for key, value in top.items():
+            self.push(month, key, value)
+
+    def months(self):
+        return sorted(self._heaps)
+
+    def top(self, month):
+        """Series with the top values of month, highest first."""
+        items = sorted(self._heaps.get(month, []), reverse=True)
+        return pd.Series([v for v, _, _ in items],
+                         index=[key for _, _, key in items], dtype=np.float64)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Average passenger weights used to recalculate RTK.
+
+The weight of each row is looked up, in order of preference, in a weight
+table by (empresa_sigla, ano), in the same table by empresa_sigla alone
+(rows with a missing ano), and in the per-nationality weights. Rows that
+match none of them get the default weight (NaN unless given).
+
+A weight table is a frame with the columns empresa_sigla, avgw and,
+optionally, ano. weight_table builds one from the calibration.
+"""
+
+import numpy as np
+import pandas as pd
+
+from anac_calibration import BOUNDS, calibrate
+from anac_consistency import TOLERANCE, check_consistency
+
+NATIONALITY_WEIGHTS = {'BRASILEIRA': 75, 'ESTRANGEIRA': 90}
+
+WEIGHT_COLUMNS = ['empresa_sigla', 'ano', 'avgw']
+
+
+def _lookup(keys, values, wanted):
+    """values[i] where keys[i] == wanted, NaN where wanted is missing."""
+    pos = keys.get_indexer(wanted)
+    return np.where(pos >= 0, values[np.maximum(pos, 0)], np.nan)
+
+
+def passenger_weights(df, table=None, nationality=NATIONALITY_WEIGHTS,
+                      default=np.nan):
+    """Average passenger weight (kg) of each row of df, as a float array."""
+    avgw = (df['empresa_nacionalidade'].map(nationality)
+            .to_numpy(dtype=np.float64, na_value=np.nan))
+    avgw = np.where(np.isnan(avgw), default, avgw)
+    if table is None or len(table) == 0:
+        return avgw
+    table = table.drop_duplicates(
+        [c for c in ('empresa_sigla', 'ano') if c in table.columns],
+        keep='last')
+    if 'ano' in table.columns:
+        general = table[table['ano'].isna()]
+        by_year = table[table['ano'].notna()]
+    else:
+        general, by_year = table, table.iloc[:0]
+    if len(general):
+        found = _lookup(pd.Index(general['empresa_sigla']),
+                        general['avgw'].to_numpy(dtype=np.float64),
+                        df['empresa_sigla'])
+        avgw = np.where(np.isnan(found), avgw, found)
+    if len(by_year):
+        keys = pd.MultiIndex.from_arrays(
+            [by_year['empresa_sigla'], by_year['ano'].astype(np.int64)])
+        found = _lookup(keys, by_year['avgw'].to_numpy(dtype=np.float64),
+                        pd.MultiIndex.from_arrays([df['empresa_sigla'],
+                                                   df['ano']]))
+        avgw = np.where(np.isnan(found), avgw, found)
+    return avgw
+
+
+def weight_table(df, by_year=True, min_rows=30, bounds=BOUNDS,
+                 tolerance=TOLERANCE):
+    """Calibrate the weight of every airline (and airline and year, with
+    by_year) that has at least min_rows rows and could be calibrated.
+    Returns a weight table."""
+    tables = []
+    levels = [['empresa_sigla', 'ano']] if by_year else []
+    for by in [['empresa_sigla']] + levels:
+        res = calibrate(df, by=by, bounds=bounds, tolerance=tolerance)
+        res = res[(res['rows'] >= min_rows) & res['k'].notna()]
+        table = res.index.to_frame(index=False)
+        table.columns = by
+        table['avgw'] = res['k'].to_numpy()
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True).reindex(
+        columns=WEIGHT_COLUMNS)
+
+
+def recalc_rtk(df, table=None, nationality=NATIONALITY_WEIGHTS,
+               default=np.nan, tolerance=TOLERANCE):
+    """Recalculate rtk_calc in df with the looked-up weights and return
+    the ConsistencyReport of the RTK check."""
+    avgw = passenger_weights(df, table, nationality, default)
+    return check_consistency(df, avgw=avgw, metrics=['rtk'],
+                             tolerance=tolerance)
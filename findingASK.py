@@ -6,38 +6,30 @@ Created on Sat May  8 20:37:16 2021
 """
 
 import os
-import pandas as pd
-import seaborn as sns
-import unidecode
+
 import numpy as np
 
+from anac_calibration import calibrate
+from anac_derive import add_derived_columns
+from anac_instrument import Instrument
+from anac_loader import CACHE_DIRNAME, load_anac
+from anac_loadfactor import frame_load_factor
+from anac_models import FEATURES, model_data, save_model, tune_regressor
+
 folder = r'C:\Users\thiag\data\ANAC-transport'
 
 dffiles = ['resumo_anual_2019.csv',
          'resumo_anual_2020.csv',
          'resumo_anual_2021.csv']
 
-df = pd.concat([pd.read_csv(os.path.join(folder, x),
-                            sep=';', encoding=('ISO-8859-1'))
-                for x in dffiles])
-
-df.columns = [unidecode.unidecode(z.lower())
-              .replace(' ','_')
-              .replace('(','')
-              .replace(')','') 
-              for z in df.columns]
+inst = Instrument()
 
-df.to_csv('3years.csv', sep=';', index=False)
-df['data'] = [str(x['ano']) + '-' + "{:02}".format(x['mes'])
-              for index, x in df.iterrows()]
+with inst.stage('load') as stage:
+    df = load_anac(folder, dffiles)
+    stage.rows = len(df)
 
-df['rota'] = [str(x['aeroporto_de_origem_sigla']) + '->' +
-              str(x['aeroporto_de_destino_sigla'])
-              for index, x in df.iterrows()]
-
-df['rota_nome'] = [str(x['aeroporto_de_origem_nome']) + '->' +
-              str(x['aeroporto_de_destino_nome'])
-              for index, x in df.iterrows()]
+with inst.stage('derive', len(df)):
+    df = add_derived_columns(df)
 
 # df['rpk'] = df['rpk'].fillna(0)
 # df['ask'] = df['ask'].fillna(0)
@@ -45,109 +37,58 @@ df['rota_nome'] = [str(x['aeroporto_de_origem_nome']) + '->' +
 # df['atk'] = df['atk'].fillna(0)
 df['bagagem_kg'] = df['bagagem_kg'].fillna(0)
 
-dummy = []
-for index, x in df.iterrows():
-    if x['ask'] == 0:
-        dummy.append(0)
-    elif x['ask'] < x['rpk']:
-        dummy.append(x['passageiros_pagos']/x['assentos'])
-    else:
-        dummy.append(x['rpk']/x['ask'])
-         
-df['rpk-ask'] = dummy
-del dummy
-
-
-
-
-from sklearn.model_selection import GridSearchCV
-
+# load factor of each row: 0 without ASK, paid passengers / seats when RPK
+# exceeds ASK, rpk / ask otherwise
+df['rpk-ask'] = frame_load_factor(df)
 
-from sklearn.neural_network import MLPRegressor
 
 
-X = df[[
-        'passageiros_pagos', 
-#        'passageiros_gratis',
-        'carga_paga_kg',
-#        'carga_gratis_kg',
-#        'correio_kg',
-        'distancia_voada_km',
-        'decolagens',
-#        'assentos',
-#        'carga_paga_km',
-#        'carga_gratis_km',
-#        'correio_km',
-#        'payload',
-        'bagagem_kg'
-        ]]
 
-X = X.fillna(value=0)
 
-Y1 = df['rtk']
-Y2 = df['atk']
+models = os.path.join(folder, 'models')
+cache = os.path.join(folder, CACHE_DIRNAME, 'sklearn')
 
-regr = MLPRegressor(random_state=1, max_iter=1000).fit(X, Y1)
+X, Y1 = model_data(df, 'rtk')
+with inst.stage('model', len(X)):
+    search = tune_regressor(X, Y1, cache_dir=cache)
+regr = search.best_estimator_
+save_model(regr, os.path.join(models, 'rtk.joblib'), FEATURES, 'rtk',
+           params=search.best_params_)
 
 Ypred = regr.predict(X)
 
+print(search.best_params_, search.best_score_)
 print(regr.score(X,Y1))
 
 for z in X.columns:
     print(z, np.corrcoef(X[z],Y1)[0,1])
+
+X2, Y2 = model_data(df, 'atk')
+with inst.stage('model_atk', len(X2)):
+    search2 = tune_regressor(X2, Y2, cache_dir=cache)
+save_model(search2.best_estimator_, os.path.join(models, 'atk.joblib'),
+           FEATURES, 'atk', params=search2.best_params_)
+
+print(search2.best_params_, search2.best_score_)
+print(search2.best_estimator_.score(X2,Y2))
     
 dummy3 = df['rtk']*1000*df['decolagens']/df['distancia_voada_km']/(
     90*df['passageiros_pagos']+df['carga_paga_kg']+df['correio_kg']+
     df['bagagem_kg'])
 
 
-def matching(k):
-    
-    dummy = []
-    for index, x in df.iterrows():
-        if x['decolagens'] == 0:
-            dummy.append(abs(x['rtk']) < 1000)
-        else:
-            dummy.append(abs(x['rtk'] - (k*x['passageiros_pagos']+x['carga_paga_kg']+x['correio_kg']+x['bagagem_kg'])*x['distancia_voada_km']/
-                             (1000*x['decolagens'])) < 1000)
-    return 1/sum(dummy)
-
-def matching_br(k):
-    
-    dummy = []
-    for index, x in df[df['empresa_nacionalidade']=='BRASILEIRA'].iterrows():
-        if x['decolagens'] == 0:
-            dummy.append(abs(x['rtk']) < 1000)
-        else:
-            dummy.append(abs(x['rtk'] - (k*x['passageiros_pagos']+x['carga_paga_kg']+x['correio_kg']+x['bagagem_kg'])*x['distancia_voada_km']/
-                             (1000*x['decolagens'])) < 1000)
-    return 1/sum(dummy)
-
-def matching_frgn(k):
-    
-    dummy = []
-    for index, x in df[df['empresa_nacionalidade']=='ESTRANGEIRA'].iterrows():
-        if x['decolagens'] == 0:
-            dummy.append(abs(x['rtk']) < 1000)
-        else:
-            dummy.append(abs(x['rtk'] - (k*x['passageiros_pagos']+x['carga_paga_kg']+x['correio_kg']+x['bagagem_kg'])*x['distancia_voada_km']/
-                             (1000*x['decolagens'])) < 1000)
-    return 1/sum(dummy)
-
-from scipy import optimize
-
-res = optimize.minimize_scalar(matching, bounds=(70,150), method='bounded',
-                                options={'maxiter':100})
+with inst.stage('calibration', len(df)):
+    res = calibrate(df)
+    res_nat = calibrate(df, by='empresa_nacionalidade')
+    res_airline = calibrate(df, by=['empresa_sigla', 'ano'])
 
 print(res)
 
+print(res_nat)
 
-res_br = optimize.minimize_scalar(matching_br, bounds=(70,150), method='bounded',
-                                options={'maxiter':100})
-
-print(res_br)
-
-res_frgn = optimize.minimize_scalar(matching_frgn, bounds=(70,150), method='bounded',
-                                options={'maxiter':100})
+print(res_airline)
 
-print(res_frgn)
+# stage metrics of every run, for trend tracking
+print(inst.frame().to_string(index=False))
+os.makedirs(os.path.join(folder, 'metrics'), exist_ok=True)
+inst.to_csv(os.path.join(folder, 'metrics', 'findingASK.csv'), append=True)
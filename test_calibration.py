@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of anac_calibration.
+"""
+
+import numpy as np
+import pandas as pd
+
+from anac_calibration import calibrate, matching_count
+
+COLUMNS = ['empresa_sigla', 'ano', 'decolagens', 'distancia_voada_km',
+           'passageiros_pagos', 'carga_paga_kg', 'correio_kg', 'bagagem_kg',
+           'rtk']
+
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def test_calibrate_empty_frame():
+    df = frame([])
+    for by in [None, 'empresa_sigla', ['empresa_sigla', 'ano']]:
+        res = calibrate(df, by=by)
+        assert list(res.columns) == ['k', 'k_min', 'k_max', 'matches',
+                                     'rows', 'rate']
+        assert res['rows'].sum() == 0
+    assert calibrate(df, by='empresa_sigla').empty
+    assert matching_count(df, [75, 90], by='empresa_sigla').shape == (2, 0)
+
+
+def test_calibrate_missing_group_keys():
+    df = frame([[np.nan, 2021, 1, 1000, 100, 0, 0, 0, 9.]])
+    assert calibrate(df, by='empresa_sigla').empty
+
+
+def test_calibrate_recovers_weight():
+    # rtk = (k * pax + cargo) * dist / (1000 * takeoffs) with k = 90
+    df = frame([['AAA', 2021, 1, 1000, 100, 500, 0, 0, 9500.],
+                ['AAA', 2021, 2, 500, 200, 0, 0, 0, 4500.]])
+    res = calibrate(df, by='empresa_sigla')
+    assert res.loc['AAA', 'matches'] == 2
+    assert res.loc['AAA', 'k_min'] < 90 < res.loc['AAA', 'k_max']